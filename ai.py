@@ -1,183 +1,672 @@
 from const import *
-from board import Board
+from board import Board, MAX_MOVES
 from square import Square
 from piece import Piece
-import random
+from move import Move, MOVE_SQUARE_MASK, MOVE_TO_SHIFT, MOVE_CAPTURE_FLAG
+from evaluation import np, evaluate_batch, evaluate_dynamic_cells
+from ordering import MoveOrderer
+from tablebase import Tablebase
+from book import Book
+from cache import AnalysisCache
+from stats import SearchStats, PrintReporter
+import threading
 import time
-from typing import Dict, Tuple
+
+# Transposition table entry flags
+EXACT, LOWERBOUND, UPPERBOUND = 0, 1, 2
+
+TT_SIZE_MB = 16
+CHECK_INTERVAL = 64  # Nodes between two deadline checks
+PVS_EPSILON = 1e-6  # Width of the null windows of principal variation search
+ASPIRATION_WINDOW = 0.25  # Half width of the first window around the previous depth's score
+ASPIRATION_DEPTH = 3  # First depth searched with an aspiration window
+WIN_SCORE = 1000  # Score of a won game, less one per ply so that faster wins score higher
+QUIESCENCE_DEPTH = 8  # Longest capture sequence searched past the horizon
+QTT_SIZE_MB = 1  # Separate table for quiescence nodes so they do not evict main search entries
+CAPTURE_GAIN = 8  # Material value of one stone
+DELTA_MARGIN = 2  # Positional change a capture can bring on top of the stone it wins
+
+# Selective search
+LMR_DEPTH = 3  # Shallowest depth at which late moves are reduced
+LMR_MOVES = 3  # Moves searched at full depth before reductions start
+NULL_MOVE_DEPTH = 3  # Shallowest depth at which the null move is tried
+NULL_MOVE_STONES = 4  # Fewer own stones than this and passing is too often the better "move"
+FUTILITY_MARGINS = (0, 1.0, 3.0)  # Per remaining depth, the most a quiet move is expected to gain
+# Squares within two rows of each side's goal row: stones there are about to break through,
+# so moves into them are never pruned and the null move is not tried against them
+BREAKTHROUGH_SQUARES = {1: range(0, 3 * COLS), -1: range((ROWS - 3) * COLS, ROWS * COLS)}
 
 class TranspositionTable:
-    def __init__(self):
-        # Initialize Zobrist keys for each piece type and position
-        self.zobrist_keys = {
-            'white_piece': [[random.getrandbits(64) for _ in range(COLS)] for _ in range(ROWS)],
-            'black_piece': [[random.getrandbits(64) for _ in range(COLS)] for _ in range(ROWS)]
-        }
-        self.table: Dict[int, Tuple[float, int, str]] = {}  # hash -> (value, depth, flag)
-
-    def get_zobrist_key(self, board: Board) -> int:
-        """Calculate the Zobrist hash for the current board position"""
-        h = 0
-        for row in range(ROWS):
-            for col in range(COLS):
-                piece = board.state[row][col].piece
-                if isinstance(piece, Piece):
-                    piece_type = f"{'white' if piece.color == WHITE else 'black'}_{piece.__class__.__name__.lower()}"
-                    if piece_type in self.zobrist_keys:
-                        h ^= self.zobrist_keys[piece_type][row][col]
-        return h
+    """
+    Fixed-size hash table stored in one preallocated buffer.
+    Every slot holds three 64-bit words: the key xor-ed with the other two words,
+    the packed data (best move, depth, flag, generation) and the score.
+    Buckets have two slots: a depth-preferred one and an always-replace one.
+    """
+    ENTRY_SIZE = 24
+    BUCKET_SLOTS = 2
+
+    def __init__(self, size_mb=TT_SIZE_MB, buffer=None):
+        if buffer is None:
+            buffer = bytearray(self.buffer_size(size_mb))
+        self.buffer = buffer
+        self.buckets = len(buffer) // (self.ENTRY_SIZE * self.BUCKET_SLOTS)
+        self.slots = self.buckets * self.BUCKET_SLOTS
+        view = memoryview(buffer)
+        n = self.slots * 8
+        self._keys = view[:n].cast('Q')
+        self._data = view[n:2 * n].cast('Q')
+        self._scores = view[2 * n:3 * n].cast('d')
+        self._score_bits = view[2 * n:3 * n].cast('Q')
+        self.generation = 0
+
+    @classmethod
+    def buffer_size(cls, size_mb):
+        # Largest whole number of buckets that fits in size_mb megabytes
+        bucket_bytes = cls.ENTRY_SIZE * cls.BUCKET_SLOTS
+        return max(1, size_mb * 1024 * 1024 // bucket_bytes) * bucket_bytes
+
+    @staticmethod
+    def get_zobrist_key(board: Board) -> int:
+        """Zobrist hash of the current board position, maintained incrementally by the board"""
+        return board.zobrist_key
+
+    def new_search(self):
+        # Age the entries left over from previous moves
+        self.generation = (self.generation + 1) & 0xFF
+
+    def clear(self):
+        self.buffer[:] = bytes(len(self.buffer))
+        self.generation = 0
+
+    def release(self):
+        # Drop the views on the buffer so that shared memory behind it can be closed
+        for view in (self._keys, self._data, self._scores, self._score_bits):
+            view.release()
+        if isinstance(self.buffer, memoryview):
+            self.buffer.release()
+
+    def probe(self, key):
+        """Returns (score, depth, flag, move) for the key, or None. The move is packed, 0 if unknown"""
+        slot = (key % self.buckets) * self.BUCKET_SLOTS
+        for i in (slot, slot + 1):
+            data = self._data[i]
+            if self._keys[i] ^ data ^ self._score_bits[i] == key:
+                return self._scores[i], (data >> 16) & 0xFF, (data >> 24) & 0x3, data & 0xFFFF
+        return None
+
+    def store(self, key, score, depth, flag, move=0):
+        slot = (key % self.buckets) * self.BUCKET_SLOTS
+        for i in (slot, slot + 1):
+            data = self._data[i]
+            if self._keys[i] ^ data ^ self._score_bits[i] == key:
+                # Same position: refresh it, keeping the old best move if none is given
+                if not move:
+                    move = data & 0xFFFF
+                break
+        else:
+            data = self._data[slot]
+            if ((data >> 32) & 0xFF) == self.generation and ((data >> 16) & 0xFF) > depth:
+                i = slot + 1  # The depth-preferred slot holds a deeper entry of this search
+            else:
+                i = slot
+        data = (move & 0xFFFF) | (min(depth, 0xFF) << 16) | (flag << 24) | (self.generation << 32)
+        self._data[i] = data
+        self._scores[i] = score
+        self._keys[i] = key ^ data ^ self._score_bits[i]
 
 class AI:
-    def __init__(self, level, color):
+    def __init__(self, level, color, tt_size_mb=TT_SIZE_MB, tt=None, lmr=True, null_move=True, futility=True,
+                 tablebase_path=TABLEBASE_PATH, book_path=BOOK_PATH, cache_path=None, reporter=None):
         self.level = level
-        print("AI level: ", level)
+        # Where the progress of the searches goes, printed unless another reporter is given
+        self.reporter = PrintReporter() if reporter is None else reporter
+        self.reporter.info(f"AI level: {level}")
         self.color = color
         self.player = -1 if color == BLACK else 1
         self.max_depth = level
         self.move_time = 0
-        self.tt = TranspositionTable()
-
-    def eval(self, board: Board):
+        self.tt = TranspositionTable(tt_size_mb) if tt is None else tt
+        self.qtt = TranspositionTable(QTT_SIZE_MB)
+        self.nodes = 0
+        self.qnodes = 0  # Nodes searched by the quiescence search, included in nodes
+        self.repetition_draws = 0  # Repetitions met on the search path, their draws depend on the game's history
+        self.deadline = None  # Absolute time at which the running search must stop
+        self.budget_start = None  # Time from which the deadline's budget is counted
+        self.stop_event = None  # Optional event (threading or multiprocessing) that stops the search
+        self.shared_alpha = None  # Root split: best root score of all workers, a multiprocessing Value
+        self.abortable = False  # False while the first depth runs, which always completes
+        self.stopped = False
+        self.completed_depth = 0
+        self.best_value = 0
+        self.batch_leaves = np is not None  # Score the leaves below depth 1 nodes in one batch
+        self.frontier = {}  # Zobrist key -> static score of the leaves scored by the last batch
+        self.move_buffers = []  # One preallocated move list per ply
+        self.ordering = MoveOrderer()
+        self.pv_table = []  # Triangular PV table, row ply holds the best line found from that ply
+        self.principal_variation = []  # Packed moves of the last completed depth's best line
+        # Selective search, each part can be switched off
+        self.lmr = lmr
+        self.null_move = null_move
+        self.futility = futility
+        # Exact endgame results, None when the tablebase file has not been generated
+        self.tablebase = Tablebase.load(tablebase_path) if tablebase_path else None
+        self.book = Book.load(book_path) if book_path else None
+        # Optional results of earlier searches, shared on disk with other engine processes
+        self.cache = AnalysisCache(cache_path) if cache_path else None
+        if self.cache is not None:
+            self.cache.warm(self.tt)
+        self.stats = SearchStats()  # Numbers of the last search
+        # Pondering: a background search of the position after the opponent's expected reply
+        self.ponder_thread = None
+        self.ponder_stop = threading.Event()
+        self.ponder_key = None  # Zobrist key of the position being pondered
+        self.ponder_move = None  # Move found by the ponder search once it has finished
+
+    def eval(self, board: Board, time_budget=None):
+        """
+        Returns the best move for the board. Without a time budget the search runs to max_depth,
+        with one it stops at the deadline and keeps the move of the last completed depth.
+        A ponder search of the same position is carried on instead of starting over.
+        """
+        if self.ponder_thread is not None:
+            if board.zobrist_key == self.ponder_key:
+                return self.ponder_hit(board, time_budget)
+            self.stop_ponder()
         start_time = time.time()  # Start time tracking
-        move = self._iterative_deepening(board, self.max_depth, self.player)
-        time.sleep(1)
-        self.move_time = time.time() - start_time  # Calculate time taken for move
+        if self.book is not None:
+            code = self.book.choose(board)
+            if code:
+                self.move_time = time.time() - start_time
+                self.principal_variation = [code]
+                self.stats = SearchStats(self.nodes, self.qnodes)
+                self.stats.finish()
+                self.reporter.info(f"Book move: {Move.decode(code).convert_to_notation()}")
+                return Move.decode(code, board)
+        self._new_search()
+        if time_budget is None:
+            # No ponder search is running, a deadline left by an earlier ponder hit is stale
+            self.deadline = None
+            deadline = None
+        else:
+            deadline = start_time + time_budget
+        move = self._iterative_deepening(board, self.max_depth, self.player, deadline)
+        self._end_search(start_time)
         return move
 
-    def _negamax(self, board: Board, depth, player, alpha=float('-inf'), beta=float('inf')):
-        position_hash = self.tt.get_zobrist_key(board)
-        score = float('-inf')
+    def _new_search(self):
+        self.tt.new_search()
+        self.qtt.new_search()
+        self.ordering.new_search()
+        self.stats = SearchStats(self.nodes, self.qnodes)
+
+    def _end_search(self, start_time):
+        if self.cache is not None:
+            self.cache.flush()
+        self.move_time = time.time() - start_time  # Calculate time taken for move
+        self.stats.set_nodes(self.nodes, self.qnodes)
+        self.stats.finish()
+        self.reporter.search_finished(self.stats)
 
-        # Try TT move first
-        if position_hash in self.tt.table:
-            stored_score, stored_depth, flag = self.tt.table[position_hash]
+    #----------------------------------------#
+    #--------------- Pondering --------------#
+    # ---------------------------------------#
+
+    def start_ponder(self, board: Board):
+        """
+        Starts searching, in a background thread, the position after the reply the AI expects to
+        the move it just played. The board is copied, the caller keeps playing on its own.
+        Returns False when there is nothing worth pondering.
+        """
+        self.stop_ponder()
+        reply = self._expected_reply(board)
+        if not reply:
+            return False
+        ponder_board = Board.from_snapshot(board.snapshot())
+        ponder_board.make_move(reply)
+        if ponder_board.winner() is not None or (self.book is not None and self.book.entries(ponder_board.zobrist_key)):
+            return False
+        self.ponder_key = ponder_board.zobrist_key
+        self.ponder_move = None
+        # Set here rather than in the thread, so that a ponder hit cannot be overwritten
+        self.deadline = None
+        self._new_search()
+        self.ponder_thread = threading.Thread(target=self._ponder, args=(ponder_board,), daemon=True)
+        self.ponder_thread.start()
+        self.reporter.info(f"Pondering on {Move.decode(reply).convert_to_notation()}")
+        return True
+
+    def _ponder(self, board: Board):
+        # No deadline: the search runs until max_depth, a ponder hit gives it one
+        self.ponder_move = self._iterative_deepening(board, self.max_depth, self.player)
+
+    def ponder_hit(self, board: Board, time_budget=None):
+        """
+        The opponent played the expected reply: the ponder search becomes the real one, keeping
+        its table and the depths already completed, with the time budget counted from now.
+        """
+        start_time = time.time()
+        if time_budget is not None and self.ponder_thread.is_alive():
+            # A finished search has already cleared its deadline, it would be left behind for the next one
+            self.budget_start = start_time
+            self.deadline = start_time + time_budget  # Read by the running search
+        self.reporter.info("Ponder hit")
+        self.ponder_thread.join()
+        self.ponder_thread = None
+        # The search may have finished between the check and the assignment above
+        self.deadline = None
+        self.ponder_key = None
+        self._end_search(start_time)
+        move = self.ponder_move
+        return Move.decode(move.encode(), board) if move else None
+
+    def stop_ponder(self):
+        # Abandon the ponder search, its table entries stay for the next search
+        if self.ponder_thread is None:
+            return
+        self.ponder_stop.set()
+        self.ponder_thread.join()
+        self.ponder_stop.clear()
+        self.ponder_thread = None
+        self.ponder_key = None
+        self.ponder_move = None
+
+    def _expected_reply(self, board: Board):
+        """Second move of the last principal variation if the AI played its first, else the stored best move"""
+        buffer = [0] * MAX_MOVES
+        count = board.generate_moves(1 if board.side_to_move == WHITE else -1, buffer)
+        legal = buffer[:count]
+        pv = self.principal_variation
+        if len(pv) >= 2 and board.undo_stack and board.undo_stack[-1][0] == pv[0] and pv[1] in legal:
+            return pv[1]
+        entry = self.tt.probe(board.zobrist_key)
+        if entry is not None and entry[3] in legal:
+            return entry[3]
+        return 0
+
+    def close(self):
+        # Write the cached results and release the files the AI keeps open
+        self.stop_ponder()
+        if self.cache is not None:
+            self.cache.close()
+        if self.book is not None:
+            self.book.close()
+        if self.tablebase is not None:
+            self.tablebase.close()
+
+    def _time_up(self):
+        # Polled every CHECK_INTERVAL nodes so the clock is not read at every node
+        if self.abortable and ((self.deadline is not None and time.time() >= self.deadline)
+                               or (self.stop_event is not None and self.stop_event.is_set())
+                               or self.ponder_stop.is_set()):
+            self.stopped = True
+        return self.stopped
+
+    def _negamax(self, board: Board, depth, player, alpha=float('-inf'), beta=float('inf'), ply=0, allow_null=True,
+                 pv_node=True):
+        """
+        Returns (score, best move) for the side to move, the move packed as an integer (0 if none).
+        pv_node is False for the null window searches, told by the caller: after negation and rounding,
+        the width of a null window is not exactly PVS_EPSILON.
+        """
+        self.nodes += 1
+        pv_line = self._pv_line(ply)
+        if self.stopped or (not self.nodes % CHECK_INTERVAL and self._time_up()):
+            return 0, 0
+
+        position_hash = self.tt.get_zobrist_key(board)
+        alpha_orig = alpha
+        tt_move = 0
+        stats = self.stats
+        repetition_draws = self.repetition_draws
+
+        # Probe the transposition table
+        stats.tt_probes += 1
+        entry = self.tt.probe(position_hash)
+        if entry is not None:
+            stats.tt_hits += 1
+            stored_score, stored_depth, flag, tt_move = entry
+            stored_score = self._score_from_table(stored_score, ply)
             if stored_depth >= depth:
-                if flag == 'EXACT':
-                    return stored_score, None
-                elif flag == 'LOWERBOUND':
+                if flag == EXACT:
+                    stats.tt_cutoffs += 1
+                    return stored_score, tt_move
+                elif flag == LOWERBOUND:
                     alpha = max(alpha, stored_score)
-                elif flag == 'UPPERBOUND':
+                elif flag == UPPERBOUND:
                     beta = min(beta, stored_score)
                 if alpha >= beta:
-                    return stored_score, None
+                    stats.tt_cutoffs += 1
+                    return stored_score, tt_move
 
         if depth == 0:
-            return self._quiescence_search(board, alpha, beta), None
-
-        if board.final_state(self.color) != 0:
-            return self._evaluate(board) * self.player, None
-
-        # Generate and try TT move first if exists
-        legal_moves = []
-        tt_move = None
+            return self._quiescence_search(board, alpha, beta, player, ply=ply), 0
+
+        terminal = self._terminal_score(board, player, ply)
+        if terminal is not None:
+            return terminal, 0
+        # The root still needs a move, below it a covered position is answered exactly
+        if ply and self.tablebase is not None:
+            value = self.tablebase.probe(board)
+            if value is not None:
+                return self._tablebase_score(value, ply), 0
+
+        # Null window nodes are expected to fail, only they are pruned
+        static_eval = None
+        moves = self._move_buffer(ply)
+
+        # Null move: if passing the turn still fails high, a real move will too
+        if (self.null_move and allow_null and not pv_node and depth >= NULL_MOVE_DEPTH
+                and abs(beta) < WIN_SCORE / 2 and self._null_move_allowed(board, player, moves)):
+            static_eval = self._evaluate(board) * player
+            if static_eval >= beta:
+                stats.pruning['null_move_tries'] += 1
+                reduction = 2 if depth < 6 else 3
+                board.make_null_move()
+                value = -self._negamax(board, max(depth - 1 - reduction, 0), -player,
+                                       -beta, -beta + PVS_EPSILON, ply + 1, False, False)[0]
+                board.unmake_null_move()
+                if self.stopped:
+                    return 0, 0
+                if value >= beta:
+                    stats.pruning['null_move_cutoffs'] += 1
+                    return beta, 0
+
+        # Generate moves into the buffer of this ply
+        count = board.generate_moves(player, moves)
+
+        # Stored best move first, then captures, killers and history
+        self.ordering.order(board, moves, count, ply, tt_move)
+
+        # Futility pruning: close to the horizon, quiet moves cannot lift a bad position above alpha
+        if self.futility and not pv_node and depth < len(FUTILITY_MARGINS) and abs(alpha) < WIN_SCORE / 2:
+            if static_eval is None:
+                static_eval = self._evaluate(board) * player
+            margin = static_eval + FUTILITY_MARGINS[depth]
+            if margin <= alpha:
+                kept = 0
+                for i in range(count):
+                    code = moves[i]
+                    if code & MOVE_CAPTURE_FLAG or self._is_breakthrough(code, player):
+                        moves[kept] = code
+                        kept += 1
+                stats.pruning['futility_pruned'] += count - kept
+                count = kept
+                if not count:
+                    return margin, 0
+
+        # The children of a depth 1 node are all leaves, evaluate them together
+        if depth == 1 and self.batch_leaves:
+            self._score_frontier(board, moves[:count])
 
-        # Generate moves
-        for row in range(ROWS):
-            for col in range(COLS):
-                piece = board.state[row][col].piece
-                if isinstance(piece, Piece) and piece.value_sign == player:
-                    piece.clear_moves()
-                    board.calculate_moves(piece, row, col)
-                    for move in piece.valid_moves:
-                        # Check if this move leads to a TT position
-                        board.move_piece(piece, move)
-                        move_hash = self.tt.get_zobrist_key(board)
-                        board.undo_move(move)
-
-                        if move_hash == position_hash:
-                            tt_move = move
-                        else:
-                            legal_moves.append(move)
-
-        if not legal_moves and not tt_move:
-            return self._evaluate(board), None
-
-        best_move = None
-
-        # Try TT move first
-        if tt_move:
-            board.move_piece(tt_move.initial.piece, tt_move)
-            score = -self._negamax(board, depth - 1, -player, -beta, -alpha)[0]
-            board.undo_move(tt_move)
-            if score >= beta:
-                self.tt.table[position_hash] = (score, depth, 'LOWERBOUND')
-                return score, tt_move
-            best_move = tt_move
-            alpha = max(alpha, score)
-
-        # Try remaining moves
-        for move in legal_moves:
-            board.move_piece(move.initial.piece, move)
-            value = -self._negamax(board, depth - 1, -player, -beta, -max(alpha, score))[0]
-            board.undo_move(move)
+        score = float('-inf')
+        best_move = 0
+        for i in range(count):
+            code = moves[i]
+            if ply == 1 and self.shared_alpha is not None:
+                # Root split: another worker may have raised the root's alpha since this subtree started
+                beta = min(beta, -self.shared_alpha.value)
+                if score >= beta:
+                    break
+                if alpha >= beta:
+                    score = alpha  # A stored lower bound already reaches the tightened beta
+                    break
+            board.make_move(code)
+            if i == 0:
+                value = -self._negamax(board, depth - 1, -player, -beta, -alpha, ply + 1, pv_node=pv_node)[0]
+            else:
+                # Late move reductions: quiet moves ordered late are searched shallower first
+                reduction = 0
+                if (self.lmr and depth >= LMR_DEPTH and i >= LMR_MOVES and not code & MOVE_CAPTURE_FLAG
+                        and not self._is_breakthrough(code, player)):
+                    reduction = 2 if depth >= 5 and i >= 2 * LMR_MOVES else 1
+                    stats.pruning['lmr_reductions'] += 1
+                # Principal variation search: prove the move is worse with a null window,
+                # and search it again with the full window only if it is not
+                value = -self._negamax(board, depth - 1 - reduction, -player, -alpha - PVS_EPSILON, -alpha, ply + 1,
+                                       pv_node=False)[0]
+                if reduction and value > alpha:
+                    stats.pruning['lmr_researches'] += 1
+                    value = -self._negamax(board, depth - 1, -player, -alpha - PVS_EPSILON, -alpha, ply + 1,
+                                           pv_node=False)[0]
+                if alpha < value < beta:
+                    value = -self._negamax(board, depth - 1, -player, -beta, -alpha, ply + 1, pv_node=pv_node)[0]
+            board.unmake_move()
+            if self.stopped:
+                self.frontier = {}
+                return 0, 0
 
             if value > score:
                 score = value
-                best_move = move
-                alpha = max(alpha, score)
+                best_move = code
+                if score > alpha:
+                    alpha = score
+                    pv_line[:] = [code]
+                    pv_line += self.pv_table[ply + 1]
                 if score >= beta:
+                    stats.cutoffs += 1
+                    if i == 0:
+                        stats.first_move_cutoffs += 1
+                    self.ordering.update(code, depth, ply)
                     break
 
-        flag = 'EXACT'
-        if score <= alpha:
-            flag = 'UPPERBOUND'
+        self.frontier = {}
+        flag = EXACT
+        if score <= alpha_orig:
+            flag = UPPERBOUND
         elif score >= beta:
-            flag = 'LOWERBOUND'
-
-        if position_hash not in self.tt.table or stored_depth <= depth:
-            self.tt.table[position_hash] = (score, depth, flag)
+            flag = LOWERBOUND
+        stored_score = self._score_to_table(score, ply)
+        self.tt.store(position_hash, stored_score, depth, flag, best_move)
+        # A draw by repetition below this node holds in this game only, it stays out of the shared cache
+        if self.cache is not None and self.repetition_draws == repetition_draws:
+            self.cache.record(position_hash, stored_score, depth, flag, best_move)
 
         return score, best_move
 
-    def _iterative_deepening(self, board: Board, max_depth, player):
+    @staticmethod
+    def _is_breakthrough(code, player):
+        # Moves that land within two rows of the mover's goal row
+        return ((code >> MOVE_TO_SHIFT) & MOVE_SQUARE_MASK) in BREAKTHROUGH_SQUARES[player]
+
+    def _null_move_allowed(self, board: Board, player, buffer):
+        """
+        Zugzwang and breakthrough safeguards of the null move: the side to move needs enough stones,
+        no capture to make (passing would hide the tactics of the position), and the opponent must
+        have no stone close to its goal row
+        """
+        if board.eval_state.counts[player] < NULL_MOVE_STONES:
+            return False
+        zone = BREAKTHROUGH_SQUARES[-player]
+        if -player in board.cells[zone.start:zone.stop]:
+            return False
+        return not board.generate_moves(player, buffer, captures_only=True)
+
+    def _move_buffer(self, ply):
+        # Move lists are reused between nodes, one per ply
+        while len(self.move_buffers) <= ply:
+            self.move_buffers.append([0] * MAX_MOVES)
+        return self.move_buffers[ply]
+
+    def _pv_line(self, ply):
+        # Rows of the PV table are emptied on entering a node, so a child cut short leaves no stale line
+        while len(self.pv_table) <= ply + 1:
+            self.pv_table.append([])
+        line = self.pv_table[ply]
+        line.clear()
+        return line
+
+    def _iterative_deepening(self, board: Board, max_depth, player, deadline=None, start_depth=1):
         best_move = None
-        for depth in range(1, max_depth + 1):
-            print(f"Searching depth: {depth}")
+        search_start = time.time()
+        self.stopped = False
+        self.abortable = False
+        if deadline is not None:
+            # Without one, the deadline set by a ponder hit while the search runs is kept
+            self.deadline = deadline
+            self.budget_start = search_start
+        self.completed_depth = 0
+        for depth in range(start_depth, max_depth + 1):
+            self.reporter.depth_started(depth)
             start_time = time.time()  # Record the start time for each depth
-            best_value, best_move = self._negamax(board, depth, player)
+            start_nodes = self.nodes
+            best_value, code = self._aspiration_search(board, depth, player)
             end_time = time.time()  # Record the end time for each depth
-
-            # Calculate the elapsed time for this depth
-            elapsed_time = end_time - start_time
-            print(
-                f"Depth {depth}: Best move: {best_move.convert_to_notation() if best_move else 'None'} "
-                f"with value {best_value}. Time taken: {elapsed_time:.4f} seconds"
-            )
+            self.stats.set_nodes(self.nodes, self.qnodes)
+
+            if self.stopped:
+                self.reporter.depth_aborted(self.stats, depth, end_time - start_time)
+                break
+            best_move = Move.decode(code, board) if code else None
+            self.best_value = best_value
+            self.completed_depth = depth
+            # A root answered from the table leaves no line behind, keep at least the move
+            self.principal_variation = list(self.pv_table[0]) or ([code] if code else [])
+            self.abortable = True
+            self.stats.add_depth(depth, best_value, code, self.principal_variation,
+                                 self.nodes - start_nodes, end_time - start_time)
+            self.reporter.depth_finished(self.stats)
+
+            # A result within the searched depth is exact, deeper iterations cannot change it
+            if abs(best_value) >= WIN_SCORE - depth:
+                break
+
+            deadline = self.deadline
+            if deadline is not None:
+                # A deeper iteration takes longer than all previous ones together,
+                # so do not start one that has no chance to finish
+                if end_time >= deadline or end_time - self.budget_start > (deadline - self.budget_start) / 2:
+                    break
+        self.deadline = None
         return best_move
 
-    def _quiescence_search(self, board: Board, alpha: float, beta: float, depth: int = 0) -> float:
-        stand_pat = self._evaluate(board) * self.player
+    def _aspiration_search(self, board: Board, depth, player):
+        """
+        Searches the root with a window around the score of the previous depth, widening
+        the side that failed until the score falls inside it
+        """
+        if depth < ASPIRATION_DEPTH or self.completed_depth == 0:
+            return self._negamax(board, depth, player)
+        window = ASPIRATION_WINDOW
+        alpha, beta = self.best_value - window, self.best_value + window
+        while True:
+            value, code = self._negamax(board, depth, player, alpha, beta)
+            if self.stopped:
+                return value, code
+            if value <= alpha:
+                alpha = value - 2 * window if window < 4 * ASPIRATION_WINDOW else float('-inf')
+            elif value >= beta:
+                beta = value + 2 * window if window < 4 * ASPIRATION_WINDOW else float('inf')
+            else:
+                return value, code
+            window *= 2
 
-        if stand_pat >= beta:
-            return beta
-        if alpha < stand_pat:
-            alpha = stand_pat
-        if depth > -3:  # Limit quiescence depth
-            return stand_pat
+    def _quiescence_search(self, board: Board, alpha: float, beta: float, player, depth: int = 0, ply: int = 0) -> float:
+        """
+        Searches capture sequences past the horizon until the position is quiet.
+        Like in the main search a capture is never forced, so the side to move can stand pat
+        on the static evaluation instead of capturing.
+        Returns the score for player, the side to move.
+        """
+        self.nodes += 1
+        self.qnodes += 1
+        if self.stopped or (not self.nodes % CHECK_INTERVAL and self._time_up()):
+            return 0
+
+        terminal = self._terminal_score(board, player, ply)
+        if terminal is not None:
+            return terminal
+        if self.tablebase is not None:
+            value = self.tablebase.probe(board)
+            if value is not None:
+                return self._tablebase_score(value, ply)
 
         # Generate capturing moves only
-        captures = []
-        for row in range(ROWS):
-            for col in range(COLS):
-                piece = board.state[row][col].piece
-                if isinstance(piece, Piece) and piece.value_sign == self.player:
-                    piece.clear_moves()
-                    board.calculate_moves(piece, row, col)
-                    for move in piece.valid_moves:
-                        if board.state[move.final.row][move.final.col].piece is not None:
-                            captures.append(move)
+        captures = self._move_buffer(ply)
+        count = board.generate_moves(player, captures, captures_only=True)
+        stand_pat = self._evaluate(board) * player
+        if not count or depth <= -QUIESCENCE_DEPTH or stand_pat >= beta:
+            return stand_pat
 
-        for move in captures:
-            board.move_piece(move.initial.piece, move)
-            score = -self._quiescence_search(board, -beta, -alpha, depth - 1)
-            board.undo_move(move)
+        position_hash = board.zobrist_key
+        q_move = 0
+        entry = self.qtt.probe(position_hash)
+        if entry is not None:
+            stored_score, _, flag, q_move = entry
+            stored_score = self._score_from_table(stored_score, ply)
+            if (flag == EXACT or (flag == LOWERBOUND and stored_score >= beta)
+                    or (flag == UPPERBOUND and stored_score <= alpha)):
+                return stored_score
+
+        # Delta pruning: winning one stone cannot lift a hopeless position above alpha
+        if stand_pat + CAPTURE_GAIN + DELTA_MARGIN <= alpha:
+            return stand_pat + CAPTURE_GAIN + DELTA_MARGIN
+
+        self.ordering.order(board, captures, count, ply, q_move)
+        alpha_orig = alpha
+        score = stand_pat
+        alpha = max(alpha, stand_pat)
+        best_move = 0
+        for i in range(count):
+            code = captures[i]
+            board.make_move(code)
+            value = -self._quiescence_search(board, -beta, -alpha, -player, depth - 1, ply + 1)
+            board.unmake_move()
+            if self.stopped:
+                return 0
 
-            if score >= beta:
-                return beta
-            if score > alpha:
-                alpha = score
+            if value > score:
+                score = value
+                best_move = code
+                if score > alpha:
+                    alpha = score
+                if score >= beta:
+                    break
 
-        return alpha
+        flag = EXACT
+        if score <= alpha_orig:
+            flag = UPPERBOUND
+        elif score >= beta:
+            flag = LOWERBOUND
+        self.qtt.store(position_hash, self._score_to_table(score, ply), 0, flag, best_move)
+        return score
+
+    @staticmethod
+    def _tablebase_score(value, ply):
+        # Tablebase values count the plies to the end of the game, scored like finished games
+        if value > 0:
+            return WIN_SCORE - ply - value
+        if value < 0:
+            return ply - 1 - value - WIN_SCORE
+        return 0
+
+    def _terminal_score(self, board: Board, player, ply):
+        # Score of a finished game for player, the side to move, or None while it goes on
+        winner = board.winner()
+        if winner is not None:
+            won = (winner == WHITE) == (player == 1)
+            return WIN_SCORE - ply if won else ply - WIN_SCORE
+        if board.is_repetition():
+            self.repetition_draws += 1
+            return 0
+        return None
+
+    @staticmethod
+    def _score_to_table(score, ply):
+        # Won and lost scores count plies from the root, the tables keep them counted from the node
+        if score > WIN_SCORE / 2:
+            return score + ply
+        if score < -WIN_SCORE / 2:
+            return score - ply
+        return score
+
+    @staticmethod
+    def _score_from_table(score, ply):
+        if score > WIN_SCORE / 2:
+            return score - ply
+        if score < -WIN_SCORE / 2:
+            return score + ply
+        return score
 
     #----------------------------------------#
     #---------- Evaluation methods ----------#
@@ -187,35 +676,42 @@ class AI:
         """
         Enhanced evaluation function optimized for two piece types (black and white)
         """
-        material_score = self._calculate_material(board)
-        position_score = self._evaluate_positional_factors(board)
-        mobility_score = self._evaluate_mobility(board)
-        structure_score = self._evaluate_structure(board)
-        king_safety_score = self._evaluate_king_safety(board)
-        development_score = self._evaluate_development(board)
-        control_score = self._evaluate_control(board)
-
-        # Weighted combination of all factors
-        final_score = (
-                1.0 * material_score +
-                0.7 * position_score +
-                0.5 * mobility_score +
-                0.5 * structure_score +
-                0.8 * king_safety_score +
-                0.4 * development_score +
-                0.6 * control_score
-        )
-
-        # Terminal position bonus
-        final_score += 100 * -board.final_state(self.color)
-
-        # Game phase adjustments
-        game_phase = self._determine_game_phase(board)
-        if game_phase == 'endgame':
-            final_score += self._evaluate_piece_positioning(board) * 0.5
+        final_score = self.frontier.get(board.zobrist_key) if self.frontier else None
+        if final_score is None:
+            # Position-only terms are kept up to date by the board, only the rest is computed here
+            if np is not None:
+                final_score = board.eval_state.score() + evaluate_dynamic_cells(board.cells)
+            else:
+                final_score = board.eval_state.score() + self._evaluate_dynamic_terms(board)
 
         return final_score
 
+    def _score_frontier(self, board: Board, moves):
+        """Statically evaluates the positions after the packed moves in one batch, keyed by their Zobrist key"""
+        count = len(moves)
+        parent = np.frombuffer(board.cells, dtype=np.int8)
+        children = np.repeat(parent[None, :], count, axis=0)
+        index = np.arange(count)
+        codes = np.array(moves)
+        initial = codes & MOVE_SQUARE_MASK
+        final = (codes >> MOVE_TO_SHIFT) & MOVE_SQUARE_MASK
+        children[index, final] = parent[initial]
+        children[index, initial] = 0
+        captures = (codes & MOVE_CAPTURE_FLAG) != 0
+        if captures.any():
+            children[index[captures], (initial[captures] + final[captures]) >> 1] = 0
+        scores = evaluate_batch(children.reshape(count, ROWS, COLS))
+        self.frontier = {board.zobrist_key_after(code): value for code, value in zip(moves, scores.tolist())}
+
+    def _evaluate_dynamic_terms(self, board: Board):
+        """Per-square version of the terms IncrementalEval does not keep, used when NumPy is not installed"""
+        return (
+                0.5 * self._evaluate_mobility(board) +
+                0.5 * self._evaluate_structure(board) +
+                0.8 * self._evaluate_king_safety(board) +
+                0.6 * self._evaluate_control(board)
+        )
+
     @staticmethod
     def _evaluate_king_safety(board: Board):
         """Evaluates piece safety based on surrounding friendly pieces"""
@@ -238,27 +734,6 @@ class AI:
 
         return score
 
-    @staticmethod
-    def _evaluate_development(board: Board):
-        """Evaluates piece advancement and board control"""
-        score = 0
-
-        for row in range(ROWS):
-            for col in range(COLS):
-                piece = board.state[row][col].piece
-                if isinstance(piece, Piece):
-                    # Bonus for advanced pieces
-                    if piece.color == WHITE:
-                        score += (row / ROWS) * 0.3  # More points for advancing toward opponent's side
-                    else:
-                        score -= ((ROWS - 1 - row) / ROWS) * 0.3
-
-                    # Control of key squares
-                    if 2 <= row <= 5 and 2 <= col <= 5:
-                        score += 0.3 * piece.value_sign
-
-        return score
-
     @staticmethod
     def _evaluate_control(board: Board):
         """Evaluates control of key squares and lines"""
@@ -284,79 +759,6 @@ class AI:
 
         return score
 
-    @staticmethod
-    def _determine_game_phase(board: Board):
-        """Determines the current game phase based on piece count"""
-        piece_count = 0
-        for row in range(ROWS):
-            for col in range(COLS):
-                if isinstance(board.state[row][col].piece, Piece):
-                    piece_count += 1
-
-        if piece_count <= 6:
-            return 'endgame'
-        else:
-            return 'midgame'
-
-    @staticmethod
-    def _evaluate_piece_positioning(board: Board):
-        """Evaluates piece positioning, especially important in endgame"""
-        score = 0
-        for row in range(ROWS):
-            for col in range(COLS):
-                piece = board.state[row][col].piece
-                if isinstance(piece, Piece):
-                    # In endgame, centralized pieces are better
-                    center_distance = abs(4 - row) + abs(4 - col)
-                    score -= center_distance * 0.1 * piece.value_sign
-
-                    # Bonus for pieces advanced toward opponent's side
-                    if piece.color == WHITE:
-                        score += row * 0.1
-                    else:
-                        score -= (ROWS - 1 - row) * 0.1
-        return score
-
-    @staticmethod
-    def _calculate_material(board: Board):
-        # Calculate the material balance
-        score = 0
-        for row in range(ROWS):
-            for col in range(COLS):
-                piece = board.state[row][col].piece
-                if isinstance(piece, Piece):
-                    score += piece.value
-        return score
-
-    @staticmethod
-    def _evaluate_positional_factors(board: Board):
-        # Evaluate positional factors
-        score = 0
-        
-        # Center control bonus (inner 4x4)
-        center_bonus = 0.2
-        for row in range(2, 6):
-            for col in range(2, 6):
-                piece = board.state[row][col].piece
-                if isinstance(piece, Piece):
-                    score += center_bonus * piece.value_sign         
-        
-        # Edge penalty
-        edge_penalty = 0.1
-        for row in range(ROWS):
-            for col in [0, 8]:
-                piece = board.state[row][col].piece
-                if isinstance(piece, Piece):
-                    score -= edge_penalty * piece.value_sign
-        
-        for col in range(COLS):
-            for row in [0, 8]:
-                piece = board.state[row][col].piece
-                if isinstance(piece, Piece):
-                    score -= edge_penalty * piece.value_sign
-                    
-        return score
-
     @staticmethod
     def _evaluate_mobility(board: Board):
         # Evaluate piece mobility - pieces with more available moves are worth more
@@ -365,6 +767,7 @@ class AI:
             for col in range(COLS):
                 piece = board.state[row][col].piece
                 if isinstance(piece, Piece):
+                    piece.clear_moves()
                     board.calculate_moves(piece, row, col)
                     moves = len(piece.valid_moves)
                     score += moves * 0.05 * piece.value_sign
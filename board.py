@@ -1,7 +1,49 @@
 from const import *
 from square import Square
 from piece import Piece
-from move import Move
+from move import Move, MOVE_SQUARE_MASK, MOVE_TO_SHIFT, MOVE_CAPTURE_FLAG
+from zobrist import PIECE_KEYS, SIDE_KEY
+from evaluation import IncrementalEval
+from array import array
+from collections import namedtuple
+
+# Room for every square holding a stone with all of its 5 moves
+MAX_MOVES = 5 * ROWS * COLS
+
+def _build_move_tables():
+    # Per side (1 white, -1 black) and square: the (target, move) pairs of the sideways and forward
+    # steps, and the (jumped square, landing square, move) triples of the diagonal captures
+    quiet_moves, jump_moves = {}, {}
+    for sign in (1, -1):
+        forward = -sign  # White moves towards row 0, black towards row 8
+        quiet_moves[sign], jump_moves[sign] = [], []
+        for row in range(ROWS):
+            for col in range(COLS):
+                sq = row * COLS + col
+                quiet, jumps = [], []
+                for dr, dc in ((0, -1), (forward, 0), (0, 1)):
+                    if Square.in_range(row + dr, col + dc):
+                        target = (row + dr) * COLS + col + dc
+                        quiet.append((target, sq | (target << MOVE_TO_SHIFT)))
+                for dc in (-1, 1):
+                    if Square.in_range(row + 2 * forward, col + 2 * dc):
+                        over = (row + forward) * COLS + col + dc
+                        land = (row + 2 * forward) * COLS + col + 2 * dc
+                        jumps.append((over, land, sq | (land << MOVE_TO_SHIFT) | MOVE_CAPTURE_FLAG))
+                quiet_moves[sign].append(tuple(quiet))
+                jump_moves[sign].append(tuple(jumps))
+    return quiet_moves, jump_moves
+
+QUIET_MOVES, JUMP_MOVES = _build_move_tables()
+
+# Row each side has to reach to win: row 0 for white, row 8 for black
+GOAL_SQUARES = {1: range(0, COLS), -1: range((ROWS - 1) * COLS, ROWS * COLS)}
+# Squares in the order has_moves visits them, starting from each side's own back rank
+SCAN_ORDER = {1: range(ROWS * COLS - 1, -1, -1), -1: range(ROWS * COLS)}
+
+# Immutable copy of a position to hand to a search: the cells as bytes, the side to move and the keys
+# of the positions since the last forward move or capture, oldest first, the only ones that can recur
+BoardSnapshot = namedtuple('BoardSnapshot', ('cells', 'side_to_move', 'keys'))
 
 class Board:
     def __init__(self):
@@ -10,90 +52,243 @@ class Board:
         self.captured_pieces = {WHITE: [], BLACK: []}
         self.state_history = []
         self.move_history = []
+        self.undo_stack = []  # (move, captured piece, previous hash) of every move on the board
+        self._last_moves = []  # last_move before each move_piece, restored by undo_move
+        self.side_to_move = WHITE
+        # Flat mirror of the pieces, cells[row * COLS + col] is 1 (white), -1 (black) or 0 (empty)
+        self.cells = array('b', bytes(ROWS * COLS))
         self._create()
         self._add_pieces()
-    
-    def move_piece(self, piece: Piece, move: Move):
-        initial = move.initial
-        final = move.final
+        # Squares indexed like cells, for constant time access from packed moves
+        self._squares = [square for row in self.state for square in row]
+        self._zobrist_key = self._compute_zobrist_key()
+        # Times each key occurs on the current line, the game followed by the moves made by the search
+        self.position_counts = {self._zobrist_key: 1}
+        self.eval_state = IncrementalEval(self.cells)
 
-        # Check for capture
-        if move.capture:
-            captured_row = (initial.row + final.row) // 2
-            captured_col = (initial.col + final.col) // 2
-            captured_piece = self.state[captured_row][captured_col].piece
-            self.captured_pieces[
-                WHITE if captured_piece.color == BLACK else BLACK].append(captured_piece)
-            self.state[captured_row][captured_col].piece = None
+    @property
+    def zobrist_key(self):
+        # Running hash of the position, kept up to date by make_move and unmake_move
+        return self._zobrist_key
+    
+    def zobrist_key_after(self, code):
+        # Key of the position after the packed move, without making it
+        initial = code & MOVE_SQUARE_MASK
+        final = (code >> MOVE_TO_SHIFT) & MOVE_SQUARE_MASK
+        color = WHITE if self.cells[initial] == 1 else BLACK
+        keys = PIECE_KEYS[color]
+        h = self._zobrist_key ^ keys[initial] ^ keys[final] ^ SIDE_KEY
+        if code & MOVE_CAPTURE_FLAG:
+            h ^= PIECE_KEYS[BLACK if color == WHITE else WHITE][(initial + final) >> 1]
+        return h
 
-        # Update board state
-        self.state[initial.row][initial.col].piece = None
-        self.state[final.row][final.col].piece = piece
+    def move_piece(self, piece: Piece, move: Move):
+        # Play a move of the real game, keeping its notation and the captured piece
+        self.make_move(move.encode())
+        captured_piece = self.undo_stack[-1][1]
+        if captured_piece is not None:
+            self.captured_pieces[piece.color].append(captured_piece)
 
         piece.clear_moves()
         self.move_history.append(move.convert_to_notation())
-        self.state_history.append(self._get_state_hash())
+        self._last_moves.append(self.last_move)
         self.last_move = move
 
     def undo_move(self, move: Move):
-        initial = move.initial
-        final = move.final
-        piece = self.state[final.row][final.col].piece
+        # Take back the last move played with move_piece
+        captured_piece = self.undo_stack[-1][1]
+        self.unmake_move()
+        if captured_piece is not None:
+            self.captured_pieces[self.side_to_move].pop()
 
-        # Check for capture and undo
-        if move.capture:
-            captured_row = (initial.row + final.row) // 2
-            captured_col = (initial.col + final.col) // 2
-            captured_piece = self.captured_pieces[piece.color].pop()
-            self.state[captured_row][captured_col].piece = captured_piece
+        # Remove from history
+        self.move_history.pop()
+        self.last_move = self._last_moves.pop()
 
-        # Undo the move in the baord state
-        self.state[initial.row][initial.col].piece = piece
-        self.state[final.row][final.col].piece = None
+    def make_move(self, code):
+        """
+        Plays a packed move in constant time, pushing an undo record of the move, the captured
+        piece and the previous hash. Used by the search, which needs no notation history.
+        """
+        initial = code & MOVE_SQUARE_MASK
+        final = (code >> MOVE_TO_SHIFT) & MOVE_SQUARE_MASK
+        squares, cells = self._squares, self.cells
+        piece = squares[initial].piece
+        sign = piece.value_sign
+        key = self._zobrist_key
+        captured_piece = None
 
-        # Remove from history
-        idx = self.move_history.index(move.convert_to_notation())
-        self.move_history.pop(idx)
-        self.state_history.pop(idx)
-        # Check if they are the first moves of the players
-        if len(self.move_history) == 0:
-            self.last_move = None
-        elif len(self.move_history) == 1:
-            self.last_move = Move.convert_to_move(self.move_history[0])
+        # Check for capture
+        if code & MOVE_CAPTURE_FLAG:
+            captured = (initial + final) >> 1
+            captured_piece = squares[captured].piece
+            squares[captured].piece = None
+            cells[captured] = 0
+            self.eval_state.remove(-sign, captured)
+            key ^= PIECE_KEYS[captured_piece.color][captured]
+
+        # Update board state
+        squares[initial].piece = None
+        squares[final].piece = piece
+        cells[initial] = 0
+        cells[final] = sign
+        self.eval_state.move(sign, initial, final)
+        if final in GOAL_SQUARES[sign]:
+            self.goal_stones[sign] += 1
+        keys = PIECE_KEYS[piece.color]
+
+        self.undo_stack.append((code, captured_piece, self._zobrist_key))
+        self._zobrist_key = key ^ keys[initial] ^ keys[final] ^ SIDE_KEY
+        self.side_to_move = BLACK if self.side_to_move == WHITE else WHITE
+        self.state_history.append(self._zobrist_key)
+        self.position_counts[self._zobrist_key] = self.position_counts.get(self._zobrist_key, 0) + 1
+
+    def unmake_move(self):
+        # Take back the last move of the undo stack
+        code, captured_piece, key = self.undo_stack.pop()
+        initial = code & MOVE_SQUARE_MASK
+        final = (code >> MOVE_TO_SHIFT) & MOVE_SQUARE_MASK
+        squares, cells = self._squares, self.cells
+        piece = squares[final].piece
+        sign = piece.value_sign
+
+        squares[final].piece = None
+        squares[initial].piece = piece
+        cells[final] = 0
+        cells[initial] = sign
+        self.eval_state.move(sign, final, initial)
+        if final in GOAL_SQUARES[sign]:
+            self.goal_stones[sign] -= 1
+
+        if captured_piece is not None:
+            captured = (initial + final) >> 1
+            squares[captured].piece = captured_piece
+            cells[captured] = -sign
+            self.eval_state.add(-sign, captured)
+
+        count = self.position_counts[self._zobrist_key] - 1
+        if count:
+            self.position_counts[self._zobrist_key] = count
+        else:
+            del self.position_counts[self._zobrist_key]
+        self._zobrist_key = key
+        self.side_to_move = BLACK if self.side_to_move == WHITE else WHITE
+        self.state_history.pop()
+
+    def make_null_move(self):
+        # Passes the turn, only for null-move pruning in the search: passing is not a legal move
+        self.undo_stack.append((0, None, self._zobrist_key))
+        self._zobrist_key ^= SIDE_KEY
+        self.side_to_move = BLACK if self.side_to_move == WHITE else WHITE
+
+    def unmake_null_move(self):
+        self._zobrist_key = self.undo_stack.pop()[2]
+        self.side_to_move = BLACK if self.side_to_move == WHITE else WHITE
+
+    def set_position(self, white_squares, black_squares, side_to_move=WHITE):
+        # Replace the pieces on the board, squares are (row, col) pairs. The game played so far is forgotten
+        for row in range(ROWS):
+            for col in range(COLS):
+                self.state[row][col].piece = None
+        for row, col in white_squares:
+            self.state[row][col].piece = Piece(WHITE)
+        for row, col in black_squares:
+            self.state[row][col].piece = Piece(BLACK)
+        self._sync_cells()
+        self.side_to_move = side_to_move
+        self.last_move = None
+        self.undo_stack.clear()
+        self._last_moves.clear()
+        self.state_history.clear()
+        self.move_history.clear()
+        for pieces in self.captured_pieces.values():
+            pieces.clear()
+        self._zobrist_key = self._compute_zobrist_key()
+        self.position_counts = {self._zobrist_key: 1}
+        self.eval_state.reset(self.cells)
+
+    def snapshot(self):
+        """
+        Snapshot of the position and of what it needs to detect repetitions. Stones never move back,
+        so positions before the last forward move or capture cannot occur again and the size does not
+        grow with the length of the game. Not for a board with a null move on it.
+        """
+        stack = self.undo_stack
+        start = len(stack)
+        while start:
+            code = stack[start - 1][0]
+            initial = code & MOVE_SQUARE_MASK
+            final = (code >> MOVE_TO_SHIFT) & MOVE_SQUARE_MASK
+            if code & MOVE_CAPTURE_FLAG or initial // COLS != final // COLS:
+                break
+            start -= 1
+        # state_history[i] is the position after undo_stack[i], the one before the first move is on the stack.
+        # The position right after the last forward move or capture can still recur, it is kept
+        if start:
+            keys = tuple(self.state_history[start - 1:])
         else:
-            self.last_move = Move.convert_to_move(self.move_history[-1])
+            keys = (stack[0][2],) + tuple(self.state_history) if stack else (self._zobrist_key,)
+        return BoardSnapshot(self.cells.tobytes(), self.side_to_move, keys)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        # New board at the snapshot's position, without the notation history of the game
+        board = cls()
+        cells = array('b', snapshot.cells)
+        board.set_position([divmod(sq, COLS) for sq in range(ROWS * COLS) if cells[sq] == 1],
+                           [divmod(sq, COLS) for sq in range(ROWS * COLS) if cells[sq] == -1],
+                           snapshot.side_to_move)
+        counts = {}
+        for key in snapshot.keys:
+            counts[key] = counts.get(key, 0) + 1
+        board.position_counts = counts
+        return board
 
     def valid_moves(self, piece, move):
         return move in piece.valid_moves
     
+    def generate_moves(self, sign, buffer, captures_only=False):
+        """
+        Writes the packed legal moves of a side (1 white, -1 black) into a preallocated buffer
+        of at least MAX_MOVES entries and returns how many were written
+        """
+        cells = self.cells
+        quiet_moves, jump_moves = QUIET_MOVES[sign], JUMP_MOVES[sign]
+        count = 0
+        for sq in range(ROWS * COLS):
+            if cells[sq] == sign:
+                for over, land, code in jump_moves[sq]:
+                    if cells[over] == -sign and not cells[land]:
+                        buffer[count] = code
+                        count += 1
+                if not captures_only:
+                    for target, code in quiet_moves[sq]:
+                        if not cells[target]:
+                            buffer[count] = code
+                            count += 1
+        return count
+
+    def legal_moves(self, color):
+        # Move objects for every legal move of a colour, for code outside the search
+        buffer = [0] * MAX_MOVES
+        count = self.generate_moves(1 if color == WHITE else -1, buffer)
+        return [Move.decode(code, self) for code in buffer[:count]]
+
     def calculate_moves(self, piece: Piece, row, col):
         # Calculate all possible legal moves of a piece on a specific position
         # There are 5 legal moves a piece can perform, left, up, right, capture on the diagonal jumping over the opponent
         if isinstance(piece, Piece):
-            direction = -1 if piece.color == WHITE else 1
-            possible_moves = {
-                'translation': [(row, col-direction), (row+direction, col), (row, col+direction)],
-                'capture': [(row+direction, col-1), (row+direction, col+1)]
-                }
-            for name, possible_move in possible_moves.items():
-                for possible_row, possible_col in possible_move:
-                    if Square.in_range(possible_row, possible_col):
-                        initial = self.state[row][col]
-                        if self.state[possible_row][possible_col].has_opponent(piece.color) and name == 'capture':
-                            # Calculate the landing square for capture
-                            land_row = possible_row + direction
-                            land_col = possible_col + (1 if possible_col > col else -1)
-                            if Square.in_range(land_row, land_col) and self.state[land_row][land_col].is_empty():
-                                final = self.state[land_row][land_col]
-                                move = Move(initial, final, True)
-                                if move not in piece.valid_moves:
-                                    piece.add_moves(move) # append new legal moves to piece class
-                        if self.state[possible_row][possible_col].is_empty() and name == 'translation':
-                            # Calculate the landing square for movement
-                            final = self.state[possible_row][possible_col]
-                            move = Move(initial, final)
-                            if move not in piece.valid_moves:
-                                piece.add_moves(move)
+            sign, sq = piece.value_sign, row * COLS + col
+            for over, land, code in JUMP_MOVES[sign][sq]:
+                if self.cells[over] == -sign and not self.cells[land]:
+                    move = Move.decode(code, self)
+                    if move not in piece.valid_moves:
+                        piece.add_moves(move) # append new legal moves to piece class
+            for target, code in QUIET_MOVES[sign][sq]:
+                if not self.cells[target]:
+                    move = Move.decode(code, self)
+                    if move not in piece.valid_moves:
+                        piece.add_moves(move)
 
     def _create(self):
         for row in range(ROWS):
@@ -118,6 +313,46 @@ class Board:
         self.state[6][6] = Square(6, 6, Piece(WHITE))
         self.state[5][3] = Square(5, 3, Piece(WHITE))
         self.state[5][5] = Square(5, 5, Piece(WHITE))
+        self._sync_cells()
+
+    def _sync_cells(self):
+        for row in range(ROWS):
+            for col in range(COLS):
+                piece = self.state[row][col].piece
+                self.cells[row * COLS + col] = piece.value_sign if isinstance(piece, Piece) else 0
+        # Stones standing on their goal row. A stone there can never be captured,
+        # the jump over it would land off the board
+        self.goal_stones = {sign: sum(self.cells[sq] == sign for sq in GOAL_SQUARES[sign]) for sign in (1, -1)}
+
+    #----------------------------------------#
+    #---------- Terminal detection ----------#
+    # ---------------------------------------#
+
+    def has_moves(self, sign):
+        """True if the side (1 white, -1 black) has a legal move, stops at the first one found"""
+        cells = self.cells
+        quiet_moves, jump_moves = QUIET_MOVES[sign], JUMP_MOVES[sign]
+        for sq in SCAN_ORDER[sign]:
+            if cells[sq] == sign:
+                for target, _ in quiet_moves[sq]:
+                    if not cells[target]:
+                        return True
+                for over, land, _ in jump_moves[sq]:
+                    if cells[over] == -sign and not cells[land]:
+                        return True
+        return False
+
+    def winner(self):
+        """Returns the colour that has won, or None while the game is still going. Leaves the pieces untouched."""
+        counts = self.eval_state.counts
+        if self.goal_stones[1] or not counts[-1]:
+            return WHITE
+        if self.goal_stones[-1] or not counts[1]:
+            return BLACK
+        sign = 1 if self.side_to_move == WHITE else -1
+        if not self.has_moves(sign):
+            return BLACK if sign == 1 else WHITE
+        return None
 
     def final_state(self, color):
         # Function to check win conditions and draw conditions
@@ -125,50 +360,30 @@ class Board:
         opponent = BLACK if color == WHITE else WHITE
         if self._check_win_condition(color) or self._check_no_pieces(opponent) or self._check_no_moves(opponent):
             return 1 if color == WHITE else -1
-        elif self._check_threefold_repetition():
+        elif self.is_repetition():
             return 0.00001
         else:
             return 0
     
-    def _get_state_hash(self):
-        return tuple(tuple(str(square) if isinstance(square.piece, Piece)
-                           else None for square in row) for row in self.state)
-
-    def _check_threefold_repetition(self):
-        # Ensure we have enough moves to check for threefold repetition
-        if len(self.state_history) < 6:
-            return False
-
-        # Consider only the last six states
-        recent_states = self.state_history[-6:]
-
-        # Get the hash of the current state
-        current_state = self._get_state_hash()
-
-        # Count occurrences of the current state in the last six moves
-        repetition_count = sum(1 for state in recent_states if state == current_state)
+    def _compute_zobrist_key(self):
+        # Full recomputation, only needed when the position is set up
+        h = SIDE_KEY if self.side_to_move == BLACK else 0
+        for row in range(ROWS):
+            for col in range(COLS):
+                piece = self.state[row][col].piece
+                if isinstance(piece, Piece):
+                    h ^= PIECE_KEYS[piece.color][row * COLS + col]
+        return h
 
-        # Check if it occurred three or more times
-        return repetition_count >= 3
+    def is_repetition(self):
+        # The current position occurred three times on the line, anywhere since the start of the game
+        return self.position_counts.get(self._zobrist_key, 0) >= 3
     
     def _check_win_condition(self, color):
-        if color == WHITE:
-            return any(isinstance(self.state[0][i].piece, Piece)
-                       and self.state[0][i].piece.color == WHITE for i in range(COLS))
-        elif color == BLACK:
-            return any(isinstance(self.state[8][i].piece, Piece)
-                       and self.state[8][i].piece.color == BLACK for i in range(COLS))
+        return self.goal_stones[1 if color == WHITE else -1] > 0
     
     def _check_no_moves(self, color):
-        for row in range(ROWS):
-            for col in range(ROWS):
-                piece = self.state[row][col].piece
-                if isinstance(piece, Piece) and piece.color == color:
-                    self.calculate_moves(piece, row, col)
-                    if piece.valid_moves:
-                        return False
-        return True
+        return not self.has_moves(1 if color == WHITE else -1)
 
     def _check_no_pieces(self, color):
-        return not any(isinstance(square.piece, Piece)
-                       and square.piece.color == color for row in self.state for square in row)
\ No newline at end of file
+        return not self.eval_state.counts[1 if color == WHITE else -1]
@@ -0,0 +1,132 @@
+from const import *
+from board import Board, MAX_MOVES
+from move import Move
+from mapfile import MappedFile
+from bisect import bisect_left
+import argparse
+import os
+import random
+import struct
+
+# Opening book file: a header, then the Zobrist keys of the book positions sorted in increasing
+# order, then the packed move and the weight of each entry. A position with several book moves
+# has one entry per move, next to each other.
+MAGIC = b'FOB1'
+HEADER = struct.Struct('<4sIQ')  # magic, reserved, number of entries
+BOOK_PLIES = 8  # Moves of the game that get book entries
+RANDOM_PLIES = 2  # Opening moves played at random while building, so the games differ
+
+
+class Book:
+    """Read-only opening book, memory-mapped and searched with a binary search on the keys"""
+
+    def __init__(self, path):
+        self._file = MappedFile(path, HEADER, MAGIC, 'an opening book')
+        _, _, count = self._file.header
+        start = HEADER.size
+        self.keys = self._file.view(start, 8 * count, 'Q')
+        start += 8 * count
+        self.moves = self._file.view(start, 2 * count, 'H')
+        start += 2 * count
+        self.weights = self._file.view(start, 2 * count, 'H')
+        self.rng = random.Random()
+
+    @staticmethod
+    def load(path):
+        # The book is optional, None when the file has not been built
+        return Book(path) if os.path.exists(path) else None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def entries(self, key):
+        """(move, weight) pairs stored for a Zobrist key"""
+        i = bisect_left(self.keys, key)
+        result = []
+        while i < len(self.keys) and self.keys[i] == key:
+            result.append((self.moves[i], self.weights[i]))
+            i += 1
+        return result
+
+    def choose(self, board: Board):
+        """
+        Picks a book move for the side to move at random, proportionally to the weights.
+        Returns the packed move, or 0 when the position is not in the book.
+        """
+        entries = self.entries(board.zobrist_key)
+        if not entries:
+            return 0
+        # Guard against key collisions: only moves that are legal here are played
+        buffer = [0] * MAX_MOVES
+        count = board.generate_moves(1 if board.side_to_move == WHITE else -1, buffer)
+        legal = set(buffer[:count])
+        entries = [(move, weight) for move, weight in entries if move in legal]
+        if not entries:
+            return 0
+        return self.rng.choices([move for move, _ in entries], [weight for _, weight in entries])[0]
+
+    def close(self):
+        self._file.close()
+
+
+def write(path, weights):
+    """Writes a {(key, move): weight} dict as a book file"""
+    entries = sorted(weights.items())
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, 0, len(entries)))
+        f.write(struct.pack(f'<{len(entries)}Q', *(key for (key, _), _ in entries)))
+        f.write(struct.pack(f'<{len(entries)}H', *(move for (_, move), _ in entries)))
+        f.write(struct.pack(f'<{len(entries)}H', *(min(weight, 0xFFFF) for _, weight in entries)))
+
+
+def build(path, games, depth, plies=BOOK_PLIES, seed=0, verbose=True):
+    """
+    Plays games against itself and books the move a search of the given depth picks in every position
+    of the first plies. The first RANDOM_PLIES moves actually played are random so that the games
+    differ, and every game reaching a position adds one to the weight of its book move.
+    """
+    from ai import AI  # The search is only needed to build the book, not to read it
+    from stats import NullReporter
+
+    rng = random.Random(seed)
+    weights = {}
+    if os.path.exists(path):
+        # Extend an existing book instead of starting over
+        book = Book(path)
+        for i in range(len(book)):
+            weights[(book.keys[i], book.moves[i])] = book.weights[i]
+        book.close()
+
+    searched = {}  # Zobrist key -> move picked by the search, positions are searched once
+    buffer = [0] * MAX_MOVES
+    players = {color: AI(depth, color, tablebase_path=None, book_path=None, reporter=NullReporter())
+               for color in (WHITE, BLACK)}
+    for game in range(games):
+        board = Board()
+        for ply in range(plies):
+            if board.winner() is not None:
+                break
+            key = board.zobrist_key
+            if key not in searched:
+                searched[key] = players[board.side_to_move].eval(board).encode()
+            code = searched[key]
+            weights[(key, code)] = weights.get((key, code), 0) + 1
+            if ply < RANDOM_PLIES:
+                count = board.generate_moves(1 if board.side_to_move == WHITE else -1, buffer)
+                code = buffer[rng.randrange(count)]
+            move = Move.decode(code, board)
+            board.move_piece(move.initial.piece, move)
+        if verbose:
+            print(f"Game {game + 1}/{games}: {' '.join(board.move_history)}")
+    write(path, weights)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the Fianco opening book from self-play")
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--depth', type=int, default=6, help="search depth of the self-play moves")
+    parser.add_argument('--plies', type=int, default=BOOK_PLIES, help="moves of each game added to the book")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=BOOK_PATH)
+    args = parser.parse_args()
+    build(args.output, args.games, args.depth, args.plies, args.seed)
\ No newline at end of file
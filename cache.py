@@ -0,0 +1,98 @@
+from zobrist import ZOBRIST_SEED
+import atexit
+import sqlite3
+import threading
+
+CACHE_VERSION = 2  # 2: won and lost scores are stored relative to the position
+CACHE_MIN_DEPTH = 4  # Shallower results are cheaper to search again than to store
+BUSY_TIMEOUT = 10  # Seconds to wait for another process writing to the same file
+
+
+def _signed(key):
+    # SQLite integers are signed 64-bit
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+def _unsigned(key):
+    return key + (1 << 64) if key < 0 else key
+
+
+class AnalysisCache:
+    """
+    Search results kept on disk in an SQLite file shared by every engine process.
+    Deep results are collected during the search with record(), written with flush() (also at exit),
+    and loaded into a transposition table with warm() when an engine starts.
+    Zobrist keys come from a fixed seed, so they mean the same position in every process.
+    Won and lost scores count the plies from the stored position, not from the root of a search.
+    The connection may be used from any thread, like the engine's search thread, one at a time.
+    """
+
+    def __init__(self, path, min_depth=CACHE_MIN_DEPTH):
+        self.path = path
+        self.min_depth = min_depth
+        self.pending = {}  # key -> (score, depth, flag, move) waiting for the next flush
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")  # Readers do not wait for writers
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS positions ("
+                        "key INTEGER PRIMARY KEY, depth INTEGER, flag INTEGER, score REAL, move INTEGER)")
+        self._check_meta()
+        atexit.register(self.close)
+
+    def _check_meta(self):
+        # Results computed with other keys or another format describe other positions, drop them
+        meta = dict(self.db.execute("SELECT name, value FROM meta"))
+        expected = {'version': str(CACHE_VERSION), 'zobrist_seed': str(ZOBRIST_SEED)}
+        if meta != expected:
+            with self.db:
+                self.db.execute("DELETE FROM positions")
+                self.db.execute("DELETE FROM meta")
+                self.db.executemany("INSERT INTO meta VALUES (?, ?)", expected.items())
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+
+    def record(self, key, score, depth, flag, move):
+        if depth < self.min_depth:
+            return
+        pending = self.pending.get(key)
+        if pending is None or depth >= pending[1]:
+            self.pending[key] = (score, depth, flag, move)
+
+    def warm(self, tt, limit=None):
+        """Stores the deepest cached results in a transposition table, returns how many"""
+        limit = tt.slots if limit is None else limit
+        count = 0
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT * FROM (SELECT key, score, depth, flag, move FROM positions ORDER BY depth DESC LIMIT ?) "
+                "ORDER BY depth", (limit,)).fetchall()
+        for key, score, depth, flag, move in rows:
+            # Shallowest first, so deeper entries win the depth-preferred slots
+            tt.store(_unsigned(key), score, depth, flag, move)
+            count += 1
+        return count
+
+    def flush(self):
+        """Writes the pending results, keeping whichever of the stored and the new one is deeper"""
+        with self.lock:
+            if not self.pending or self.db is None:
+                return
+            rows = [(_signed(key), depth, flag, score, move) for key, (score, depth, flag, move) in self.pending.items()]
+            with self.db:
+                self.db.executemany(
+                    "INSERT INTO positions (key, depth, flag, score, move) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET depth = excluded.depth, flag = excluded.flag, "
+                    "score = excluded.score, move = excluded.move WHERE excluded.depth >= positions.depth", rows)
+            self.pending = {}
+
+    def close(self):
+        if self.db is None:
+            return
+        self.flush()
+        with self.lock:
+            self.db.close()
+            self.db = None
+        atexit.unregister(self.close)
\ No newline at end of file
@@ -16,6 +16,15 @@ SQUARE_SIZE = WIDTH // COLS
 # Frame rate
 FPS = 30
 
+# AI time management
+MOVES_TO_GO = 30  # Expected number of remaining AI moves when splitting the clock
+MIN_MOVE_TIME = 0.1
+
+# Endgame tablebase, generated with python tablebase.py
+TABLEBASE_PATH = 'tablebase.bin'
+# Opening book, built with python book.py
+BOOK_PATH = 'book.bin'
+
 # Colors
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
@@ -0,0 +1,239 @@
+# Headless engine speaking a UCI-style text protocol on stdin/stdout, for servers without a display.
+# Imports neither pygame nor the GUI.
+#
+#   uci                                  -> id lines, uciok
+#   isready                              -> readyok
+#   setoption name Hash value <mb>       -> resize the transposition table
+#   ucinewgame                           -> clear the tables, back to the start position
+#   position startpos|fen <fen> [moves <move> ...]
+#   go [depth <n>] [movetime <ms>] [wtime <ms>] [btime <ms>] [movestogo <n>] [infinite]
+#   stop                                 -> stop the search, bestmove follows
+#   quit
+#
+# Moves use the game notation (e.g. e2-e3, c4xe6). A fen lists the rows from row 9 down to row 1,
+# separated by '/', with W for a white stone, B for a black stone and digits for empty squares,
+# then the side to move (w or b).
+from const import *
+from board import Board, MAX_MOVES
+from move import Move, MOVE_CAPTURE_FLAG
+from ai import AI, TranspositionTable, TT_SIZE_MB, WIN_SCORE
+from stats import NullReporter
+import argparse
+import sys
+import threading
+
+ENGINE_NAME = 'Fianco'
+ENGINE_AUTHOR = 'alexanderleonidas'
+ENGINE_MAX_DEPTH = 64  # Depth limit of searches bounded by time only
+
+
+def parse_fen(fen):
+    """Returns the (row, col) squares of the white and black stones and the side to move"""
+    fields = fen.split()
+    rows = fields[0].split('/')
+    if len(rows) != ROWS or len(fields) != 2 or fields[1] not in ('w', 'b'):
+        raise ValueError(f"Invalid position: {fen}")
+    white, black = [], []
+    for row, text in enumerate(rows):
+        col = 0
+        for char in text:
+            if char.isdigit():
+                col += int(char)
+            elif char in 'WB':
+                (white if char == 'W' else black).append((row, col))
+                col += 1
+            else:
+                raise ValueError(f"Invalid position: {fen}")
+        if col != COLS:
+            raise ValueError(f"Invalid position: {fen}")
+    return white, black, WHITE if fields[1] == 'w' else BLACK
+
+
+def find_move(board: Board, notation):
+    """Legal packed move of the side to move matching the notation, 0 if there is none"""
+    try:
+        code = Move.convert_to_move(notation).encode()
+    except (KeyError, ValueError, IndexError):
+        return 0
+    buffer = [0] * MAX_MOVES
+    count = board.generate_moves(1 if board.side_to_move == WHITE else -1, buffer)
+    for legal in buffer[:count]:
+        if (legal & ~MOVE_CAPTURE_FLAG) == code:
+            return legal
+    return 0
+
+
+def setup_board(fen=None, moves=()):
+    """Board of a position given as an optional fen and the moves played from it, ValueError if invalid"""
+    board = Board()
+    if fen is not None:
+        board.set_position(*parse_fen(fen))
+    for notation in moves:
+        code = find_move(board, notation)
+        if not code:
+            raise ValueError(f"illegal move {notation}")
+        move = Move.decode(code, board)
+        board.move_piece(move.initial.piece, move)
+    return board
+
+
+def format_score(value):
+    # Centi-stones, or the number of moves to the end of the game once a result is found
+    if abs(value) > WIN_SCORE / 2:
+        plies = WIN_SCORE - abs(value)
+        moves = (int(round(plies)) + 1) // 2
+        return f"mate {moves if value > 0 else -moves}"
+    return f"cp {int(round(value * 100))}"
+
+
+class UciReporter(NullReporter):
+    """Reports the search to the engine's output as protocol info lines, and nothing else"""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def info(self, text):
+        self.engine.send(f"info string {text}")
+
+    def depth_finished(self, stats):
+        record = stats.depths[-1]
+        self.engine.send(f"info depth {record['depth']} score {format_score(record['score'])} nodes {stats.nodes} "
+                         f"nps {stats.nps} time {int(stats.elapsed * 1000)} pv {' '.join(record['pv'])}")
+
+
+class Engine:
+    def __init__(self, out=sys.stdout, tt_size_mb=TT_SIZE_MB, cache_path=None):
+        self.out = out
+        self.tt_size_mb = tt_size_mb
+        self.cache_path = cache_path
+        self.board = Board()
+        self.ai = self._create_ai()
+        self.search_thread = None
+
+    def _create_ai(self):
+        return AI(ENGINE_MAX_DEPTH, WHITE, self.tt_size_mb, cache_path=self.cache_path, reporter=UciReporter(self))
+
+    def send(self, line):
+        self.out.write(line + '\n')
+        self.out.flush()
+
+    def handle(self, line):
+        """Runs one command, returns False when the engine should quit"""
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == 'uci':
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send(f"option name Hash type spin default {TT_SIZE_MB} min 1 max 4096")
+            self.send("uciok")
+        elif command == 'isready':
+            self.send("readyok")
+        elif command == 'setoption':
+            self._set_option(args)
+        elif command == 'ucinewgame':
+            self.stop()
+            self.ai.tt.clear()
+            self.ai.qtt.clear()
+            self.ai.ordering.clear()
+            self.board = Board()
+        elif command == 'position':
+            self.stop()
+            self._set_position(args)
+        elif command == 'go':
+            self.stop()
+            self._go(args)
+        elif command == 'stop':
+            self.stop()
+        elif command == 'quit':
+            self.stop()
+            self.ai.close()
+            return False
+        else:
+            self.send(f"info string unknown command {command}")
+        return True
+
+    def _set_option(self, args):
+        if len(args) == 4 and args[0] == 'name' and args[1].lower() == 'hash' and args[2] == 'value':
+            self.stop()
+            self.tt_size_mb = max(1, int(args[3]))
+            self.ai.tt = TranspositionTable(self.tt_size_mb)
+        else:
+            self.send(f"info string unknown option {' '.join(args)}")
+
+    def _set_position(self, args):
+        moves = []
+        if 'moves' in args:
+            i = args.index('moves')
+            args, moves = args[:i], args[i + 1:]
+        fen = ' '.join(args[1:]) if args and args[0] == 'fen' else None
+        try:
+            self.board = setup_board(fen, moves)
+        except ValueError as error:
+            self.send(f"info string {error}")
+
+    def _go(self, args):
+        options = {}
+        i = 0
+        while i < len(args):
+            if args[i] == 'infinite':
+                options['infinite'] = True
+                i += 1
+            elif i + 1 < len(args) and args[i + 1].isdigit():
+                options[args[i]] = int(args[i + 1])
+                i += 2
+            else:
+                i += 1
+
+        side = self.board.side_to_move
+        time_budget = None
+        if 'movetime' in options:
+            time_budget = options['movetime'] / 1000
+        elif not options.get('infinite'):
+            remaining = options.get('wtime' if side == WHITE else 'btime')
+            if remaining is not None:
+                remaining /= 1000
+                moves_to_go = options.get('movestogo', MOVES_TO_GO)
+                time_budget = max(MIN_MOVE_TIME, min(remaining / moves_to_go, remaining / 2))
+
+        ai = self.ai
+        ai.color = side
+        ai.player = 1 if side == WHITE else -1
+        ai.max_depth = options.get('depth', ENGINE_MAX_DEPTH)
+        ai.stop_event = threading.Event()
+        self.search_thread = threading.Thread(target=self._search, args=(self.board, time_budget), daemon=True)
+        self.search_thread.start()
+
+    def _search(self, board, time_budget):
+        move = self.ai.eval(board, time_budget)
+        self.send(f"bestmove {move.convert_to_notation() if move else '(none)'}")
+
+    def stop(self):
+        # Stops a running search and waits for its bestmove
+        if self.search_thread is not None:
+            self.ai.stop_event.set()
+            self.search_thread.join()
+            self.search_thread = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless Fianco engine")
+    parser.add_argument('--hash', type=int, default=TT_SIZE_MB, help="transposition table size in MB")
+    parser.add_argument('--cache', default=None, help="persistent analysis cache file")
+    args = parser.parse_args()
+
+    # The protocol owns stdout, anything else printed goes to stderr
+    out = sys.stdout
+    sys.stdout = sys.stderr
+    engine = Engine(out, args.hash, args.cache)
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    else:
+        engine.stop()
+        engine.ai.close()
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
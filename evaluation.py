@@ -0,0 +1,189 @@
+# Vectorized version of the AI evaluation. A position is a 9x9 int8 array holding 1 for white,
+# -1 for black and 0 for empty squares, and every term is computed with whole-board array
+# operations instead of scanning the squares and generating moves piece by piece.
+from const import *
+
+try:
+    import numpy as np
+except ImportError:  # AI falls back to its per-square evaluation
+    np = None
+
+# Weights of the terms that depend on more than one square, as combined in AI._evaluate.
+# The weights of material (1.0), position (0.7), development (0.4) and endgame positioning (0.5)
+# are folded into the integer tables below.
+MOBILITY_WEIGHT = 0.5
+STRUCTURE_WEIGHT = 0.5
+KING_SAFETY_WEIGHT = 0.8
+CONTROL_WEIGHT = 0.6
+ENDGAME_PIECES = 6
+
+SQUARES = ROWS * COLS
+# Extra cells appended to a flat position: off the board, then a black and a white stone
+OFF_BOARD, ANY_BLACK, ANY_WHITE = SQUARES, SQUARES + 1, SQUARES + 2
+
+NEIGHBOURS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+
+# The terms that only depend on where each stone stands (material, centre and edge position,
+# development and endgame positioning) are kept in integer units of 1/EVAL_SCALE, so they
+# add up exactly no matter in which order stones are added and removed
+EVAL_SCALE = 300
+
+
+def _local_weights(sign):
+    weights, endgame = [], []
+    for row in range(ROWS):
+        for col in range(COLS):
+            center = 1 if 2 <= row <= 5 and 2 <= col <= 5 else 0
+            edges = (col == 0) + (col == COLS - 1) + (row == 0) + (row == ROWS - 1)
+            distance = abs(4 - row) + abs(4 - col)
+            if sign == 1:
+                # 8 material + 0.7 * (0.2 centre - 0.1 edge) + 0.4 * (0.3 row / 9 + 0.3 centre)
+                weights.append(2400 + 78 * center - 21 * edges + 4 * row)
+                # 0.5 * (0.1 row - 0.1 distance to the centre)
+                endgame.append(15 * row - 15 * distance)
+            else:
+                weights.append(-2400 - 78 * center + 21 * edges - 4 * (ROWS - 1 - row))
+                endgame.append(15 * distance - 15 * (ROWS - 1 - row))
+    return weights, endgame
+
+
+LOCAL_WEIGHTS, ENDGAME_WEIGHTS = {}, {}
+for _sign in (1, -1):
+    LOCAL_WEIGHTS[_sign], ENDGAME_WEIGHTS[_sign] = _local_weights(_sign)
+
+
+class IncrementalEval:
+    """
+    Sums of the position-only evaluation terms for a board, updated stone by stone
+    by Board.make_move and Board.unmake_move instead of being recomputed at every leaf.
+    """
+
+    def __init__(self, cells):
+        self.reset(cells)
+
+    def reset(self, cells):
+        self.local = 0
+        self.endgame = 0
+        self.counts = {1: 0, -1: 0}
+        for sq, sign in enumerate(cells):
+            if sign:
+                self.add(sign, sq)
+
+    def add(self, sign, sq):
+        self.local += LOCAL_WEIGHTS[sign][sq]
+        self.endgame += ENDGAME_WEIGHTS[sign][sq]
+        self.counts[sign] += 1
+
+    def remove(self, sign, sq):
+        self.local -= LOCAL_WEIGHTS[sign][sq]
+        self.endgame -= ENDGAME_WEIGHTS[sign][sq]
+        self.counts[sign] -= 1
+
+    def move(self, sign, initial, final):
+        weights, endgame = LOCAL_WEIGHTS[sign], ENDGAME_WEIGHTS[sign]
+        self.local += weights[final] - weights[initial]
+        self.endgame += endgame[final] - endgame[initial]
+
+    def score(self):
+        """Position-only part of the evaluation from white's point of view"""
+        if self.counts[1] + self.counts[-1] <= ENDGAME_PIECES:
+            return (self.local + self.endgame) / EVAL_SCALE
+        return self.local / EVAL_SCALE
+
+
+def _square(row, col):
+    return row * COLS + col if 0 <= row < ROWS and 0 <= col < COLS else OFF_BOARD
+
+
+def _move_tables():
+    """
+    Index tables of the 5 move directions of both colours (white rows first), indexed by target square:
+    where the moving stone comes from and which square it jumps over (a cell holding an opponent
+    stone for non-capturing directions, so the jump condition always holds for them).
+    """
+    sources, jumped = [], []
+    for forward, any_opponent in ((-1, ANY_BLACK), (1, ANY_WHITE)):
+        for dr, dc, capture in ((0, -1, False), (0, 1, False), (forward, 0, False),
+                                (2 * forward, -2, True), (2 * forward, 2, True)):
+            sources.append([_square(row - dr, col - dc) for row in range(ROWS) for col in range(COLS)])
+            jumped.append([_square(row - dr // 2, col - dc // 2) if capture else any_opponent
+                           for row in range(ROWS) for col in range(COLS)])
+    return sources, jumped
+
+
+if np is not None:
+    _rows = np.repeat(np.arange(ROWS, dtype=np.float64), COLS)
+    _cols = np.tile(np.arange(COLS, dtype=np.float64), ROWS)
+    _center = ((_rows >= 2) & (_rows <= 5) & (_cols >= 2) & (_cols <= 5)).astype(np.float64)
+
+    # Integer piece-square tables indexed by [cell + 1, square], so black stones read row 0
+    # and white stones row 2
+    PST = np.zeros((3, SQUARES), dtype=np.int64)
+    PST[2], PST[0] = LOCAL_WEIGHTS[1], LOCAL_WEIGHTS[-1]
+    ENDGAME_PST = np.zeros((3, SQUARES), dtype=np.int64)
+    ENDGAME_PST[2], ENDGAME_PST[0] = ENDGAME_WEIGHTS[1], ENDGAME_WEIGHTS[-1]
+    CONTROL_TABLE = np.where(_center > 0, 0.3, 0.1)
+    SQUARE_INDEX = np.arange(SQUARES)
+
+    _sources, _jumped = _move_tables()
+    MOVE_SOURCES = np.array(_sources)
+    MOVE_JUMPED = np.array(_jumped)
+    # +1 for the white directions and -1 for the black ones, turning "own"/"opponent" into 1/-1
+    MOVE_SIGNS = np.repeat(np.array([1, -1], dtype=np.int8), 5).reshape(10, 1)
+    NEIGHBOUR_INDEX = np.array([[_square(row + dr, col + dc) for row in range(ROWS) for col in range(COLS)]
+                                for dr, dc in NEIGHBOURS])
+
+
+def evaluate_grid(grid):
+    """
+    Static score of 9x9 int8 positions from white's point of view: the weighted sum of
+    material, position, mobility, structure, king safety, development and control, plus
+    the endgame positioning term when at most ENDGAME_PIECES stones are left.
+    Leading dimensions are kept, so a (N, 9, 9) array gives N scores.
+    """
+    cells = grid.reshape(grid.shape[:-2] + (SQUARES,))
+    stones = cells + 1
+    local = PST[stones, SQUARE_INDEX].sum(axis=-1)
+    endgame = np.count_nonzero(cells, axis=-1) <= ENDGAME_PIECES
+    if np.any(endgame):
+        local = local + np.where(endgame, ENDGAME_PST[stones, SQUARE_INDEX].sum(axis=-1), 0)
+    return local / EVAL_SCALE + _dynamic_terms(cells)
+
+
+def _dynamic_terms(cells):
+    # Mobility, structure, king safety and control of flat (..., 81) positions
+    lead = cells.shape[:-1]
+    padded = np.concatenate((cells, np.broadcast_to(np.array([0, -1, 1], dtype=np.int8), lead + (3,))), axis=-1)
+
+    # Mobility and control: every direction of both colours as a (10, 81) mask of reachable targets
+    empty = (cells == 0)[..., None, :]
+    targets = ((padded[..., MOVE_SOURCES] * MOVE_SIGNS == 1)
+               & (padded[..., MOVE_JUMPED] * MOVE_SIGNS == -1) & empty)
+    counts = targets.sum(axis=-1)
+    mobility = counts[..., :5].sum(axis=-1) - counts[..., 5:].sum(axis=-1)
+    control = (targets[..., :5, :].any(axis=-2) @ CONTROL_TABLE
+               - targets[..., 5:, :].any(axis=-2) @ CONTROL_TABLE)
+
+    # Structure and king safety both reduce to the number of same-colour neighbour pairs:
+    # mixed pairs cancel out between the two colours in the structure term
+    same_colour = ((padded[..., NEIGHBOUR_INDEX] * cells[..., None, :]) == 1) * cells[..., None, :]
+    pairs = same_colour.sum(axis=(-2, -1))
+    structure = pairs * 0.1
+    king_safety = pairs * 0.2
+
+    return (MOBILITY_WEIGHT * mobility * 0.05 + STRUCTURE_WEIGHT * structure
+            + KING_SAFETY_WEIGHT * king_safety + CONTROL_WEIGHT * control)
+
+
+def evaluate_dynamic_cells(cells):
+    """Only the terms that are not kept by IncrementalEval, for a flat buffer of 81 cells"""
+    return float(_dynamic_terms(np.frombuffer(cells, dtype=np.int8)))
+
+
+def evaluate_batch(positions):
+    """Scores an (N, 9, 9) array of positions in one vectorized call, returns N scores"""
+    positions = np.asarray(positions, dtype=np.int8)
+    if positions.ndim != 3 or positions.shape[1:] != (ROWS, COLS):
+        raise ValueError(f"Expected an (N, {ROWS}, {COLS}) array, got shape {positions.shape}")
+    return evaluate_grid(positions)
@@ -1,10 +1,9 @@
-from copy import deepcopy
-import pygame
 from const import *
 from board import Board
 from move import Move
 from mover import Mover
 from ai import AI
+import time
 
 class Game:
     def __init__(self):
@@ -18,14 +17,14 @@ class Game:
         self.running = True
         self.white_time = 600  # 10 minutes in seconds
         self.black_time = 600  # 10 minutes in seconds
-        self.last_tick = pygame.time.get_ticks()  # Track last tick for timing updates
+        self.last_tick = time.monotonic()  # Track last tick for timing updates, in seconds
         self.game_started = False  # Flag to track if the game has started
         self.ai = None
 
     def start_game(self):
         """Call this method after the user selects a player to start the game and timer."""
         self.game_started = True
-        self.last_tick = pygame.time.get_ticks()  # Reset the last tick to start the timer
+        self.last_tick = time.monotonic()  # Reset the last tick to start the timer
 
     def start_ai(self):
         self.ai_player = BLACK if self.user_player == WHITE else WHITE
@@ -35,6 +34,8 @@ class Game:
         self.player = WHITE if self.player == BLACK else BLACK
     
     def reset(self):
+        if self.ai is not None:
+            self.ai.stop_ponder()
         self.__init__()
 
     def is_over(self):
@@ -67,9 +68,15 @@ class Game:
             self.next_turn()  # Switch turn to the next player
             self.mover.unpick_piece()
     
+    def ai_time_budget(self):
+        """Seconds the AI may spend on its next move, taken from its remaining clock"""
+        remaining = self.white_time if self.ai_player == WHITE else self.black_time
+        return max(MIN_MOVE_TIME, min(remaining / MOVES_TO_GO, remaining / 2))
+
     def get_ai_move(self):
-        copy_board = deepcopy(self.board)
-        move = self.ai.eval(copy_board)
+        # The search plays on its own board, rebuilt from a snapshot of the position
+        search_board = Board.from_snapshot(self.board.snapshot())
+        move = self.ai.eval(search_board, time_budget=self.ai_time_budget())
         if move:
             piece = self.board.state[move.initial.row][move.initial.col].piece
 
@@ -79,4 +86,9 @@ class Game:
             else:
                 self.black_time -= self.ai.move_time
 
-            return piece, move
\ No newline at end of file
+            return piece, move
+
+    def ponder(self):
+        """Lets the AI think about its next move while the user thinks about theirs"""
+        if self.game_mode == 'pvc' and self.running and self.ai is not None:
+            self.ai.start_ponder(self.board)
\ No newline at end of file
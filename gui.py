@@ -3,6 +3,7 @@ from game import Game
 from square import Square
 import pygame
 import threading
+import time
 
 class GUI:
     def __init__(self, game: Game):
@@ -46,6 +47,7 @@ class GUI:
             self.game.select_piece(piece, move.initial.row, move.initial.col)
             self.game.move_piece(move.final.row, move.final.col)
             self.ai_running = False
+        self.game.ponder()
 
     def handle_ai_move(self):
         """Handles the AI's move in a separate thread."""
@@ -304,8 +306,8 @@ class GUI:
 
         # Update the current player's timer (not both)
         if self.game.game_started and self.game.running and not self.game.is_over():
-            current_time = pygame.time.get_ticks()
-            elapsed_time = (current_time - self.game.last_tick) / 1000
+            current_time = time.monotonic()
+            elapsed_time = current_time - self.game.last_tick
             if self.game.player == WHITE:
                 self.game.white_time -= elapsed_time
             else:
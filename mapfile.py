@@ -0,0 +1,36 @@
+import mmap
+
+
+class MappedFile:
+    """
+    Read-only memory map of a data file that starts with a header whose first field is a magic
+    number. Typed views of the file are taken with view() and released together by close().
+    """
+
+    def __init__(self, path, header, magic, kind):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.header = self.unpack(header, 0)
+        if self.header[0] != magic:
+            self._map.close()
+            raise ValueError(f"{path} is not {kind} file")
+        self._view = memoryview(self._map)
+        self._views = []
+
+    def unpack(self, layout, offset):
+        # Fields of a struct.Struct stored at offset
+        return layout.unpack_from(self._map, offset)
+
+    def view(self, offset, length, fmt):
+        # length bytes from offset, read as items of the struct format fmt
+        view = self._view[offset:offset + length].cast(fmt)
+        self._views.append(view)
+        return view
+
+    def close(self):
+        # Views on the map have to be released before it can be closed
+        for view in self._views:
+            view.release()
+        self._views = []
+        self._view.release()
+        self._map.close()
\ No newline at end of file
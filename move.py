@@ -1,6 +1,12 @@
 from const import *
 from square import Square
 
+# Packed integer move encoding used by the engine: from | to << 7 | capture << 14,
+# where a square index is row * COLS + col
+MOVE_SQUARE_MASK = 0x7F
+MOVE_TO_SHIFT = 7
+MOVE_CAPTURE_FLAG = 1 << 14
+
 class Move:
     def __init__(self, initial: Square, final: Square, capture=False):
         # Initial and final squares
@@ -14,6 +20,21 @@ class Move:
     def __eq__(self, other):
         return self.initial == other.initial and self.final == other.final
 
+    def encode(self):
+        # Pack the move into a single integer
+        code = (self.initial.row * COLS + self.initial.col) | ((self.final.row * COLS + self.final.col) << MOVE_TO_SHIFT)
+        return code | MOVE_CAPTURE_FLAG if self.capture else code
+
+    @staticmethod
+    def decode(code, board=None):
+        # Unpack an integer move, using the squares of the board when one is given
+        initial_row, initial_col = divmod(code & MOVE_SQUARE_MASK, COLS)
+        final_row, final_col = divmod((code >> MOVE_TO_SHIFT) & MOVE_SQUARE_MASK, COLS)
+        capture = bool(code & MOVE_CAPTURE_FLAG)
+        if board is not None:
+            return Move(board.state[initial_row][initial_col], board.state[final_row][final_col], capture)
+        return Move(Square(initial_row, initial_col), Square(final_row, final_col), capture)
+
     def convert_to_notation(self):
          # Convert square coordinates to chess board coordinate notation
         from_square = f"{Square.ALPHACOLS[self.initial.col]}{ROWS - self.initial.row}"
@@ -0,0 +1,110 @@
+from const import *
+from board import JUMP_MOVES
+from move import MOVE_SQUARE_MASK, MOVE_TO_SHIFT, MOVE_CAPTURE_FLAG
+from array import array
+
+MAX_PLY = 128
+SQUARES = ROWS * COLS
+
+# Score bands, from the first move tried to the last
+TT_MOVE_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 28
+KILLER_SCORE = 1 << 26
+HISTORY_LIMIT = KILLER_SCORE - 2  # History scores stay below the killers
+
+
+def _attack_tables():
+    # Per side and square: the (attacker, landing square) pairs of the opponent captures of a stone there
+    attacks = {1: [[] for _ in range(SQUARES)], -1: [[] for _ in range(SQUARES)]}
+    for sign in (1, -1):
+        for sq in range(SQUARES):
+            for over, land, _ in JUMP_MOVES[-sign][sq]:
+                attacks[sign][over].append((sq, land))
+    return {sign: [tuple(pairs) for pairs in attacks[sign]] for sign in (1, -1)}
+
+
+ATTACKS = _attack_tables()
+
+
+class MoveOrderer:
+    """
+    Ranks the moves of a node: the transposition table move, then captures, then the two killer
+    moves of the ply, then quiet moves by their history score.
+    Captures are ranked by whether the capturing stone can be taken back straight away, then by
+    how far the captured stone had advanced: a capture that can be taken back straight away
+    usually just trades stones.
+    """
+
+    def __init__(self):
+        self.killers = array('l', bytes(2 * MAX_PLY * array('l').itemsize))
+        self.history = array('l', bytes(SQUARES * SQUARES * array('l').itemsize))
+
+    def clear(self):
+        for i in range(len(self.killers)):
+            self.killers[i] = 0
+        for i in range(len(self.history)):
+            self.history[i] = 0
+
+    def new_search(self):
+        # Killers belong to the previous position, history is kept but counts for less
+        for i in range(len(self.killers)):
+            self.killers[i] = 0
+        self._age_history()
+
+    def _age_history(self):
+        history = self.history
+        for i in range(len(history)):
+            history[i] >>= 1
+
+    def order(self, board, moves, count, ply, tt_move=0):
+        """Sorts the first count packed moves of the buffer in place, best first"""
+        if count < 2:
+            return
+        cells = board.cells
+        history = self.history
+        killer_1, killer_2 = self.killers[2 * ply], self.killers[2 * ply + 1]
+        scored = []
+        for i in range(count):
+            code = moves[i]
+            if code == tt_move:
+                score = TT_MOVE_SCORE
+            elif code & MOVE_CAPTURE_FLAG:
+                score = self._capture_score(cells, code)
+            elif code == killer_1:
+                score = KILLER_SCORE + 1
+            elif code == killer_2:
+                score = KILLER_SCORE
+            else:
+                score = history[(code & MOVE_SQUARE_MASK) * SQUARES + ((code >> MOVE_TO_SHIFT) & MOVE_SQUARE_MASK)]
+            scored.append((score, code))
+        scored.sort(reverse=True)
+        for i in range(count):
+            moves[i] = scored[i][1]
+
+    @staticmethod
+    def _capture_score(cells, code):
+        initial = code & MOVE_SQUARE_MASK
+        final = (code >> MOVE_TO_SHIFT) & MOVE_SQUARE_MASK
+        over = (initial + final) >> 1
+        sign = cells[initial]
+        # Rows the captured stone had advanced towards its goal
+        row = over // COLS
+        advance = row if sign == 1 else ROWS - 1 - row
+        safe = 1
+        for attacker, land in ATTACKS[sign][final]:
+            if cells[attacker] == -sign and (not cells[land] or land == initial or land == over):
+                safe = 0
+                break
+        return CAPTURE_SCORE + (safe << 8) + advance
+
+    def update(self, code, depth, ply):
+        """Rewards a quiet move that caused a beta cutoff"""
+        if code & MOVE_CAPTURE_FLAG:
+            return
+        if self.killers[2 * ply] != code:
+            self.killers[2 * ply + 1] = self.killers[2 * ply]
+            self.killers[2 * ply] = code
+        i = (code & MOVE_SQUARE_MASK) * SQUARES + ((code >> MOVE_TO_SHIFT) & MOVE_SQUARE_MASK)
+        self.history[i] += depth * depth
+        if self.history[i] > HISTORY_LIMIT:
+            self._age_history()
\ No newline at end of file
@@ -0,0 +1,241 @@
+from const import *
+from ai import AI, TranspositionTable, TT_SIZE_MB
+from board import Board, MAX_MOVES
+from move import Move
+from stats import SearchStats, PrintReporter, NullReporter
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import multiprocessing
+import os
+import time
+
+
+# Per-process state of the Lazy SMP pool, set up once by _lazy_smp_init and kept between moves
+_smp_ai = None
+_smp_stop = None
+_smp_shm = None
+
+
+class _StopFlag:
+    """Stop event of the helpers' searches, backed by a byte shared with the parent"""
+
+    def __init__(self, flag):
+        self.flag = flag
+
+    def is_set(self):
+        return self.flag.value != 0
+
+    def set(self):
+        self.flag.value = 1
+
+
+def _lazy_smp_init(shm_name, tt_bytes, level, stop_flag):
+    global _smp_ai, _smp_stop, _smp_shm
+    _smp_shm = shared_memory.SharedMemory(name=shm_name)
+    _smp_stop = _StopFlag(stop_flag)
+    _smp_ai = AI(level, WHITE, tt=TranspositionTable(buffer=_smp_shm.buf[:tt_bytes]), reporter=NullReporter())
+    _smp_ai.stop_event = _smp_stop
+
+
+def _lazy_smp_search(worker_id, snapshot, generation, max_depth, deadline):
+    """Runs one iterative deepening search on the shared table and returns its deepest result"""
+    ai = _smp_ai
+    board = Board.from_snapshot(snapshot)
+    ai.color = snapshot.side_to_move
+    ai.player = 1 if snapshot.side_to_move == WHITE else -1
+    if generation != ai.tt.generation:
+        ai.ordering.new_search()  # The history tables of the worker carry over from the previous move
+    ai.tt.generation = generation
+    nodes = ai.nodes
+    # Half of the helpers start one ply deeper so the workers do not all search the same depth
+    move = ai._iterative_deepening(board, max_depth, ai.player, deadline, start_depth=1 + worker_id % 2)
+    if ai.completed_depth >= max_depth:
+        _smp_stop.set()  # The other workers cannot produce a deeper answer anymore
+    return ai.completed_depth, ai.best_value, move.encode() if move else 0, worker_id, ai.nodes - nodes
+
+
+class LazySMP:
+    """
+    Parallel search: N worker processes run iterative deepening on the same root and share
+    one transposition table in shared memory. The deepest completed result wins.
+    The workers live as long as the LazySMP, so they keep their move ordering tables between moves.
+    Same interface as AI.eval, call close() to stop the workers and release the shared table.
+    """
+
+    def __init__(self, level, color, workers=None, tt_size_mb=TT_SIZE_MB, reporter=None):
+        self.level = level
+        self.color = color
+        self.max_depth = level
+        self.workers = workers or os.cpu_count() or 1
+        self.reporter = PrintReporter() if reporter is None else reporter
+        self.move_time = 0
+        self.nodes = 0
+        self.completed_depth = 0
+        self.best_value = 0
+        self.stats = SearchStats()
+        self.generation = 0
+        self.tt_bytes = TranspositionTable.buffer_size(tt_size_mb)
+        self.shm = shared_memory.SharedMemory(create=True, size=self.tt_bytes)
+        self.shm.buf[:self.tt_bytes] = bytes(self.tt_bytes)
+        ctx = multiprocessing.get_context()
+        self.stop_flag = ctx.Value('b', 0, lock=False)
+        self.pool = ProcessPoolExecutor(self.workers, ctx, initializer=_lazy_smp_init,
+                                        initargs=(self.shm.name, self.tt_bytes, level, self.stop_flag))
+
+    def eval(self, board: Board, time_budget=None):
+        start_time = time.time()
+        self.stats = SearchStats()
+        self.generation = (self.generation + 1) & 0xFF
+        deadline = start_time + time_budget if time_budget is not None else None
+        # The snapshot keeps the positions of the game that the search must see as repetitions
+        snapshot = board.snapshot()
+
+        self.stop_flag.value = 0
+        futures = [self.pool.submit(_lazy_smp_search, i, snapshot, self.generation, self.max_depth, deadline)
+                   for i in range(self.workers)]
+        # A worker that raises, or dies, fails its future instead of leaving the caller waiting
+        try:
+            answers = [future.result() for future in futures]
+        except BaseException:
+            self.stop_flag.value = 1
+            for future in futures:
+                future.cancel()
+            raise
+
+        # Deepest completed iteration first, the lowest worker id breaks ties
+        depth, value, code, _, _ = max(answers, key=lambda answer: (answer[0], -answer[3]))
+        self.completed_depth = depth
+        self.best_value = value
+        self.nodes = sum(answer[4] for answer in answers)
+        self.move_time = time.time() - start_time
+        # Only the node count and the final depth are known here, the details stay in the workers
+        self.stats.nodes = self.nodes
+        if depth:
+            self.stats.add_depth(depth, value, code, [code] if code else [], self.nodes, self.move_time)
+        self.stats.finish()
+        self.reporter.search_finished(self.stats)
+        return Move.decode(code, board) if code else None
+
+    def close(self):
+        self.pool.shutdown()
+        self.shm.close()
+        self.shm.unlink()
+
+
+# Per-process state of the root-split pool, set up once by _root_split_init
+_worker_ai = None
+_shared_alpha = None
+
+
+def _root_split_init(level, color, tt_size_mb, shared_alpha):
+    global _worker_ai, _shared_alpha
+    _worker_ai = AI(level, color, tt_size_mb, reporter=NullReporter())
+    _worker_ai.shared_alpha = shared_alpha
+    _shared_alpha = shared_alpha
+
+
+def _root_split_search(snapshot, code, depth, generation, deadline):
+    """
+    Searches the subtree of one root move. Returns (score, exact, nodes): the score is None if the
+    deadline hit, and exact is False when the score is only an upper bound, the move having failed
+    low against the shared alpha
+    """
+    ai = _worker_ai
+    ai.color = snapshot.side_to_move
+    ai.player = 1 if snapshot.side_to_move == WHITE else -1
+    if generation != ai.tt.generation:
+        ai.ordering.new_search()  # First subtree of a new move
+    ai.tt.generation = generation
+    ai.stopped = False
+    ai.abortable = deadline is not None
+    ai.deadline = deadline
+    nodes = ai.nodes
+    board = Board.from_snapshot(snapshot)
+    board.make_move(code)
+    # Start from the best score any worker has found so far at this depth
+    alpha = _shared_alpha.value
+    score = -ai._negamax(board, depth - 1, -ai.player, float('-inf'), -alpha, 1)[0]
+    if ai.stopped:
+        return None, False, ai.nodes - nodes
+    # The search tightens its window as the shared alpha grows, and the shared alpha only ever
+    # holds exact scores: beating its current value means the subtree did not fail low
+    with _shared_alpha.get_lock():
+        exact = score > _shared_alpha.value
+        if exact:
+            _shared_alpha.value = score
+    return score, exact, ai.nodes - nodes
+
+
+class RootSplit:
+    """
+    Parallel search that hands the root moves of every depth to a process pool.
+    Workers share the best root score through shared memory and use it as their alpha bound.
+    Same interface as AI.eval, call close() to shut the pool down.
+    """
+
+    def __init__(self, level, color, workers=None, tt_size_mb=TT_SIZE_MB, reporter=None):
+        self.level = level
+        self.color = color
+        self.max_depth = level
+        self.workers = workers or os.cpu_count() or 1
+        self.reporter = PrintReporter() if reporter is None else reporter
+        self.move_time = 0
+        self.nodes = 0
+        self.completed_depth = 0
+        self.best_value = 0
+        self.stats = SearchStats()
+        self.generation = 0
+        ctx = multiprocessing.get_context()
+        self.shared_alpha = ctx.Value('d', float('-inf'))
+        self.pool = ProcessPoolExecutor(self.workers, ctx, initializer=_root_split_init,
+                                        initargs=(level, color, tt_size_mb, self.shared_alpha))
+
+    def eval(self, board: Board, time_budget=None):
+        start_time = time.time()
+        self.generation = (self.generation + 1) & 0xFF
+        deadline = start_time + time_budget if time_budget is not None else None
+        # The snapshot keeps the positions of the game that the search must see as repetitions
+        snapshot = board.snapshot()
+        buffer = [0] * MAX_MOVES
+        codes = buffer[:board.generate_moves(1 if board.side_to_move == WHITE else -1, buffer)]
+        if not codes:
+            return None
+
+        best_code = codes[0]
+        self.completed_depth = 0
+        self.nodes = 0
+        self.stats = stats = SearchStats()
+        for depth in range(1, self.max_depth + 1):
+            self.reporter.depth_started(depth)
+            depth_start = time.time()
+            # The best move of the previous depth goes first so it sets alpha early
+            codes.remove(best_code)
+            codes.insert(0, best_code)
+            self.shared_alpha.value = float('-inf')
+            futures = [self.pool.submit(_root_split_search, snapshot, code, depth, self.generation,
+                                        deadline if depth > 1 else None) for code in codes]
+            results = [future.result() for future in futures]
+            depth_nodes = sum(nodes for _, _, nodes in results)
+            self.nodes += depth_nodes
+            stats.nodes = self.nodes
+            if any(score is None for score, _, _ in results):
+                self.reporter.depth_aborted(stats, depth, time.time() - depth_start)
+                break
+
+            # Moves that failed low return upper bounds, which may equal the best score: only exact ones win
+            best_score = max(score for score, exact, _ in results if exact)
+            best_code = next(code for code, (score, exact, _) in zip(codes, results) if exact and score == best_score)
+            self.best_value = best_score
+            self.completed_depth = depth
+            stats.add_depth(depth, best_score, best_code, [best_code], depth_nodes, time.time() - depth_start)
+            self.reporter.depth_finished(stats)
+            if deadline is not None and time.time() - start_time > (deadline - start_time) / 2:
+                break
+
+        self.move_time = time.time() - start_time
+        stats.finish()
+        self.reporter.search_finished(stats)
+        return Move.decode(best_code, board)
+
+    def close(self):
+        self.pool.shutdown()
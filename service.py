@@ -0,0 +1,204 @@
+# Engine service for many simultaneous games: JSON lines over a TCP or Unix socket, searches run
+# on a bounded process pool.
+#
+# Requests, one JSON object per line:
+#   {"id": 1, "type": "bestmove", "fen": "...", "moves": ["f1-f2"], "depth": 6, "movetime": 500, "deadline": 2000}
+#   {"id": 2, "type": "analyze", ...}    same fields, the answer also carries the principal variation
+#                                        and the search statistics
+#   {"id": 1, "type": "cancel"}          stops request 1, which answers with the best move found so far
+# fen and moves are optional (start position), movetime and deadline are in milliseconds: movetime is
+# the search time and deadline the latest time after receiving the request at which the answer is due.
+# Answers carry the request id, and an "error" field when the request failed or was refused.
+from const import *
+from ai import AI, TT_SIZE_MB
+from engine import setup_board, ENGINE_MAX_DEPTH
+from move import Move
+from stats import NullReporter
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+
+DEFAULT_DEPTH = 6
+QUEUE_LIMIT = 16  # Requests waiting for a worker, beyond that new requests are refused as busy
+
+
+#----------------------------------------#
+#--------------- Workers ----------------#
+# ---------------------------------------#
+
+# Per-process state of the pool, set up once by _service_init
+_worker_ai = None
+_cancel_flags = None
+
+
+class _CancelFlag:
+    """Stop event of a search, backed by one slot of the array of cancel flags shared with the server"""
+
+    def __init__(self, slot):
+        self.slot = slot
+
+    def is_set(self):
+        return _cancel_flags[self.slot] != 0
+
+
+def _service_init(cancel_flags, tt_size_mb):
+    global _worker_ai, _cancel_flags
+    _cancel_flags = cancel_flags
+    # Nobody reads a worker's output, the statistics go back with the answer
+    _worker_ai = AI(ENGINE_MAX_DEPTH, WHITE, tt_size_mb, book_path=None, reporter=NullReporter())
+
+
+def _service_search(slot, fen, moves, depth, time_budget):
+    """Searches one position, returns the answer fields"""
+    if _cancel_flags[slot]:
+        return {'cancelled': True}
+    board = setup_board(fen, moves)
+    ai = _worker_ai
+    ai.color = board.side_to_move
+    ai.player = 1 if board.side_to_move == WHITE else -1
+    ai.max_depth = depth
+    ai.stop_event = _CancelFlag(slot)
+    move = ai.eval(board, time_budget)
+    return {
+        'bestmove': move.convert_to_notation() if move else None,
+        'score': ai.best_value,
+        'depth': ai.completed_depth,
+        'nodes': ai.stats.nodes,
+        'pv': [Move.decode(code).convert_to_notation() for code in ai.principal_variation],
+        'stats': ai.stats.to_dict(),
+        'cancelled': bool(_cancel_flags[slot]),
+    }
+
+
+#----------------------------------------#
+#---------------- Server ----------------#
+# ---------------------------------------#
+
+class EngineService:
+    def __init__(self, workers=None, queue_limit=QUEUE_LIMIT, tt_size_mb=TT_SIZE_MB):
+        self.workers = workers or os.cpu_count() or 1
+        # One cancel flag per request that can be admitted at the same time
+        slots = self.workers + queue_limit
+        ctx = multiprocessing.get_context()
+        self.cancel_flags = ctx.Array('b', slots, lock=False)
+        self.free_slots = list(range(slots))
+        self.running = {}  # (connection, request id) -> slot
+        self.worker_slots = asyncio.Semaphore(self.workers)
+        self.pool = ProcessPoolExecutor(self.workers, ctx, initializer=_service_init,
+                                        initargs=(self.cancel_flags, tt_size_mb))
+
+    async def handle_connection(self, reader, writer):
+        lock = asyncio.Lock()  # Answers of concurrent requests must not interleave
+
+        async def send(message):
+            async with lock:
+                writer.write((json.dumps(message) + '\n').encode())
+                await writer.drain()
+
+        tasks = set()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+                request_id = request.get('id')
+            except (ValueError, AttributeError):
+                await send({'id': None, 'error': 'invalid JSON request'})
+                continue
+            if not (request_id is None or isinstance(request_id, (str, int))):
+                # Ids key the running requests, lists and objects cannot
+                await send({'id': None, 'error': 'request id must be a string, an integer or null'})
+                continue
+            kind = request.get('type')
+            if kind == 'cancel':
+                slot = self.running.get((id(writer), request_id))
+                if slot is not None:
+                    self.cancel_flags[slot] = 1
+                continue
+            if kind not in ('bestmove', 'analyze'):
+                await send({'id': request_id, 'error': f"unknown request type {kind}"})
+                continue
+            if (id(writer), request_id) in self.running:
+                await send({'id': request_id, 'error': 'request id already running'})
+                continue
+            if not self.free_slots:
+                # Backpressure: the pool and its queue are full, the client has to retry later
+                await send({'id': request_id, 'error': 'busy'})
+                continue
+            slot = self.free_slots.pop()
+            self.cancel_flags[slot] = 0
+            self.running[(id(writer), request_id)] = slot
+            task = asyncio.create_task(self._run(request, slot, send, id(writer)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        # The client is gone, stop its searches
+        for (connection, _), slot in self.running.items():
+            if connection == id(writer):
+                self.cancel_flags[slot] = 1
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        writer.close()
+
+    async def _run(self, request, slot, send, connection):
+        request_id = request.get('id')
+        received = time.time()
+        try:
+            depth = int(request.get('depth', DEFAULT_DEPTH if 'movetime' not in request else ENGINE_MAX_DEPTH))
+            budgets = [request[name] / 1000 for name in ('movetime', 'deadline') if name in request]
+            async with self.worker_slots:
+                # Time spent waiting in the queue counts against the deadline
+                if 'deadline' in request:
+                    budgets[-1] -= time.time() - received
+                time_budget = max(MIN_MOVE_TIME, min(budgets)) if budgets else None
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self.pool, _service_search, slot, request.get('fen'), request.get('moves', ()), depth, time_budget)
+            if request.get('type') != 'analyze':
+                result.pop('pv', None)
+                result.pop('stats', None)
+            await send({'id': request_id, **result})
+        except ConnectionError:
+            pass
+        except Exception as error:
+            # Bad fields, or anything that went wrong in the worker: the client still gets an answer
+            await send({'id': request_id, 'error': str(error) or type(error).__name__})
+        finally:
+            del self.running[(connection, request_id)]
+            self.free_slots.append(slot)
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+async def serve(host='127.0.0.1', port=8765, unix_path=None, workers=None, queue_limit=QUEUE_LIMIT,
+                tt_size_mb=TT_SIZE_MB):
+    service = EngineService(workers, queue_limit, tt_size_mb)
+    if unix_path is not None:
+        server = await asyncio.start_unix_server(service.handle_connection, unix_path)
+    else:
+        server = await asyncio.start_server(service.handle_connection, host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fianco engine service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None, help="listen on a Unix socket at this path instead")
+    parser.add_argument('--workers', type=int, default=None, help="search processes, one per CPU by default")
+    parser.add_argument('--queue', type=int, default=QUEUE_LIMIT, help="requests that may wait for a worker")
+    parser.add_argument('--hash', type=int, default=TT_SIZE_MB, help="transposition table size per worker in MB")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers, args.queue, args.hash))
+    except KeyboardInterrupt:
+        pass
\ No newline at end of file
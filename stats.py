@@ -0,0 +1,174 @@
+from move import Move
+import json
+import sys
+import time
+
+PRUNING_COUNTERS = ('lmr_reductions', 'lmr_researches', 'null_move_tries', 'null_move_cutoffs', 'futility_pruned')
+
+
+def _notation(code):
+    return Move.decode(code).convert_to_notation()
+
+
+class SearchStats:
+    """
+    Numbers of one search, filled in by the AI while it runs. The node counts of the AI keep growing
+    from search to search, the ones here start from zero. TT counters are for the main table only,
+    the quiescence table is not counted.
+    """
+
+    def __init__(self, base_nodes=0, base_qnodes=0):
+        self.start_time = time.time()
+        self.end_time = None
+        self._base_nodes = base_nodes
+        self._base_qnodes = base_qnodes
+        self.nodes = 0
+        self.qnodes = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = 0  # Nodes answered by the table without a search
+        self.cutoffs = 0  # Beta cutoffs in the move loop
+        self.first_move_cutoffs = 0  # Of those, cutoffs by the first move searched
+        self.pruning = dict.fromkeys(PRUNING_COUNTERS, 0)
+        self.depths = []  # One record per completed depth
+
+    def set_nodes(self, nodes, qnodes):
+        # From the AI's running totals
+        self.nodes = nodes - self._base_nodes
+        self.qnodes = qnodes - self._base_qnodes
+
+    def add_depth(self, depth, score, code, pv, nodes, seconds):
+        self.depths.append({
+            'depth': depth,
+            'score': score,
+            'move': _notation(code) if code else None,
+            'nodes': nodes,
+            'time': seconds,
+            'pv': [_notation(move) for move in pv],
+        })
+
+    def finish(self):
+        self.end_time = time.time()
+
+    @property
+    def elapsed(self):
+        return (self.end_time or time.time()) - self.start_time
+
+    @property
+    def nps(self):
+        return int(self.nodes / max(self.elapsed, 1e-6))
+
+    @property
+    def depth(self):
+        return self.depths[-1]['depth'] if self.depths else 0
+
+    @property
+    def pv(self):
+        return self.depths[-1]['pv'] if self.depths else []
+
+    @property
+    def tt_hit_rate(self):
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    @property
+    def first_move_cutoff_rate(self):
+        # Share of the cutoffs found by the first move, high when the move ordering is good
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    @property
+    def branching_factor(self):
+        # Effective branching factor: growth of the node count between the last two completed depths
+        if len(self.depths) < 2 or not self.depths[-2]['nodes']:
+            return 0.0
+        return self.depths[-1]['nodes'] / self.depths[-2]['nodes']
+
+    def to_dict(self):
+        return {
+            'depth': self.depth,
+            'nodes': self.nodes,
+            'qnodes': self.qnodes,
+            'time': self.elapsed,
+            'nps': self.nps,
+            'tt_probes': self.tt_probes,
+            'tt_hits': self.tt_hits,
+            'tt_cutoffs': self.tt_cutoffs,
+            'tt_hit_rate': self.tt_hit_rate,
+            'cutoffs': self.cutoffs,
+            'first_move_cutoff_rate': self.first_move_cutoff_rate,
+            'branching_factor': self.branching_factor,
+            'pruning': dict(self.pruning),
+            'pv': self.pv,
+            'depths': self.depths,
+        }
+
+
+#----------------------------------------#
+#--------------- Reporters --------------#
+# ---------------------------------------#
+
+class NullReporter:
+    """Receives the progress of the searches and drops it. Base of the other reporters"""
+
+    def info(self, text):
+        pass
+
+    def depth_started(self, depth):
+        pass
+
+    def depth_finished(self, stats: SearchStats):
+        # The completed depth is stats.depths[-1]
+        pass
+
+    def depth_aborted(self, stats: SearchStats, depth, seconds):
+        pass
+
+    def search_finished(self, stats: SearchStats):
+        pass
+
+
+class PrintReporter(NullReporter):
+    """Human readable progress on stdout"""
+
+    def info(self, text):
+        print(text)
+
+    def depth_started(self, depth):
+        print(f"Searching depth: {depth}")
+
+    def depth_finished(self, stats):
+        record = stats.depths[-1]
+        print(f"Depth {record['depth']}: Best move: {record['move']} with value {record['score']}. "
+              f"Time taken: {record['time']:.4f} seconds. Nodes: {record['nodes']} ({stats.nps} nps). "
+              f"PV: {' '.join(record['pv'])}")
+
+    def depth_aborted(self, stats, depth, seconds):
+        print(f"Depth {depth}: Aborted after {seconds:.4f} seconds")
+
+    def search_finished(self, stats):
+        print(f"Nodes: {stats.nodes} ({stats.qnodes} quiescence), {stats.nps} nps in {stats.elapsed:.4f} seconds. "
+              f"TT: {stats.tt_probes} probes, {stats.tt_hit_rate:.1%} hits, {stats.tt_cutoffs} cutoffs. "
+              f"First move cutoffs: {stats.first_move_cutoff_rate:.1%}. Branching factor: {stats.branching_factor:.2f}")
+        print("Pruning: " + ", ".join(f"{name} {count}" for name, count in stats.pruning.items()))
+
+
+class JsonLinesReporter(NullReporter):
+    """One JSON object per event, for tools that tune or monitor the engine"""
+
+    def __init__(self, out=None):
+        self.out = sys.stdout if out is None else out
+
+    def _write(self, event, **fields):
+        self.out.write(json.dumps({'event': event, **fields}) + '\n')
+        self.out.flush()
+
+    def info(self, text):
+        self._write('info', message=text)
+
+    def depth_finished(self, stats):
+        self._write('depth', nodes_total=stats.nodes, nps=stats.nps, **stats.depths[-1])
+
+    def depth_aborted(self, stats, depth, seconds):
+        self._write('aborted', depth=depth, time=seconds)
+
+    def search_finished(self, stats):
+        self._write('search', **stats.to_dict())
\ No newline at end of file
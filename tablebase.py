@@ -0,0 +1,253 @@
+from const import *
+from bitboard import BitBoard, SQUARES
+from move import MOVE_SQUARE_MASK, MOVE_TO_SHIFT, MOVE_CAPTURE_FLAG
+from mapfile import MappedFile
+from itertools import combinations
+from array import array
+import argparse
+import heapq
+import os
+import struct
+
+# Endgame tablebase: for every position with few stones, the exact result with perfect play.
+# Values are signed bytes from the point of view of the side to move:
+#   0        draw (or a position that cannot occur)
+#   d > 0    the side to move wins in d plies
+#   -(d + 1) the side to move loses in d plies, -1 is a finished game that was lost
+# A position's index combines the colex ranks of the white and of the black squares with the side
+# to move: ((rank(white) * C(81, black stones) + rank(black)) << 1) | (1 if black is to move)
+MAGIC = b'FTB1'
+HEADER = struct.Struct('<4sII')  # magic, largest stone count, number of tables
+ENTRY = struct.Struct('<BBQQ')  # white stones, black stones, offset, length
+MAX_STONES = 3
+MAX_DTM = 126
+
+
+def _binomials(n, k):
+    table = [[0] * (k + 1) for _ in range(n + 1)]
+    for i in range(n + 1):
+        table[i][0] = 1
+        for j in range(1, min(i, k) + 1):
+            table[i][j] = table[i - 1][j - 1] + (table[i - 1][j] if j <= i - 1 else 0)
+    return table
+
+
+BINOMIAL = _binomials(SQUARES, 8)
+
+
+def rank(squares):
+    """Colex rank of an increasing sequence of squares among all sets of the same size"""
+    return sum(BINOMIAL[sq][i + 1] for i, sq in enumerate(squares))
+
+
+def index(white, black, side):
+    # White and black are increasing square sequences
+    return ((rank(white) * BINOMIAL[SQUARES][len(black)] + rank(black)) << 1) | (side == BLACK)
+
+
+def table_size(white_stones, black_stones):
+    return BINOMIAL[SQUARES][white_stones] * BINOMIAL[SQUARES][black_stones] * 2
+
+
+def materials(max_stones):
+    # Every (white, black) stone count with both sides on the board, smaller material first
+    return [(w, total - w) for total in range(2, max_stones + 1) for w in range(1, total)]
+
+
+#----------------------------------------#
+#-------------- Generation --------------#
+# ---------------------------------------#
+
+def _predecessors(white, black, side):
+    """
+    Indices of the positions that reach this one with a non-capturing move of the side that
+    just moved. Captures change the material, so they are not un-made within a table.
+    """
+    mover = BLACK if side == WHITE else WHITE
+    own, other = (white, black) if mover == WHITE else (black, white)
+    occupied = set(own) | set(other)
+    back = COLS if mover == WHITE else -COLS  # One row back from the mover's forward direction
+    result = []
+    for i, sq in enumerate(own):
+        col = sq % COLS
+        sources = [sq + back] if 0 <= sq + back < SQUARES else []
+        if col > 0:
+            sources.append(sq - 1)
+        if col < COLS - 1:
+            sources.append(sq + 1)
+        for source in sources:
+            if source in occupied:
+                continue
+            moved = tuple(sorted(own[:i] + (source,) + own[i + 1:]))
+            if mover == WHITE:
+                result.append(index(moved, black, WHITE))
+            else:
+                result.append(index(white, moved, BLACK))
+    return result
+
+
+def _squares_after(white, black, side, code):
+    # White and black squares after the packed move of side
+    initial = code & MOVE_SQUARE_MASK
+    final = (code >> MOVE_TO_SHIFT) & MOVE_SQUARE_MASK
+    own, other = (list(white), list(black)) if side == WHITE else (list(black), list(white))
+    own[own.index(initial)] = final
+    if code & MOVE_CAPTURE_FLAG:
+        other.remove((initial + final) >> 1)
+    own, other = tuple(sorted(own)), tuple(sorted(other))
+    return (own, other) if side == WHITE else (other, own)
+
+
+def generate_table(white_stones, black_stones, probe):
+    """
+    Retrograde analysis of one material configuration. probe(white, black, side) gives the
+    value of the smaller configurations reached by captures, which must already be solved.
+    """
+    size = table_size(white_stones, black_stones)
+    values = array('b', bytes(size))
+    solved = bytearray(size)
+    counters = array('H', bytes(2 * size))  # Moves of a position not yet proven to lose
+    loss_depth = array('B', bytes(size))  # Longest loss among the moves proven to lose so far
+    heap = []  # (plies to the end, index), smallest first so every result gets its shortest win
+
+    for white in combinations(range(SQUARES), white_stones):
+        for black in combinations(range(SQUARES), black_stones):
+            if set(white) & set(black):
+                continue
+            for side in (WHITE, BLACK):
+                i = index(white, black, side)
+                position = BitBoard(sum(1 << sq for sq in white), sum(1 << sq for sq in black), side)
+                winner = position.winner()
+                if winner is not None:
+                    if winner != side:
+                        heapq.heappush(heap, (0, i))
+                    else:
+                        solved[i] = 1  # Cannot occur: the game ended before it was this side's turn
+                    continue
+                counter = 0
+                for code in position.generate_moves():
+                    if not code & MOVE_CAPTURE_FLAG:
+                        counter += 1
+                        continue
+                    child = probe(*_squares_after(white, black, side, code), BLACK if side == WHITE else WHITE)
+                    if child > 0:
+                        loss_depth[i] = max(loss_depth[i], child + 1)
+                        continue
+                    if child < 0:
+                        heapq.heappush(heap, (-child, i))  # Lost for the opponent in -child - 1 plies
+                    # Winning and drawn captures never count down, so the position cannot be lost
+                    counter += 1
+                counters[i] = counter
+                if not counter:
+                    heapq.heappush(heap, (loss_depth[i], i))
+
+    while heap:
+        depth, i = heapq.heappop(heap)
+        if solved[i]:
+            continue
+        if depth > MAX_DTM:
+            raise ValueError(f"Distance to mate {depth} does not fit in a signed byte")
+        solved[i] = 1
+        # Even depths are losses for the side to move, odd ones wins
+        lost = depth % 2 == 0
+        values[i] = -(depth + 1) if lost else depth
+
+        white, black, side = _unindex(i, white_stones, black_stones)
+        for p in _predecessors(white, black, side):
+            if solved[p]:
+                continue
+            if lost:
+                heapq.heappush(heap, (depth + 1, p))
+            else:
+                loss_depth[p] = max(loss_depth[p], depth + 1)
+                counters[p] -= 1
+                if not counters[p]:
+                    heapq.heappush(heap, (loss_depth[p], p))
+    return values
+
+
+def _unrank(r, k):
+    # Increasing squares of colex rank r among the k-sets
+    squares = []
+    for i in range(k, 0, -1):
+        sq = i - 1
+        while BINOMIAL[sq + 1][i] <= r:
+            sq += 1
+        squares.append(sq)
+        r -= BINOMIAL[sq][i]
+    return tuple(reversed(squares))
+
+
+def _unindex(i, white_stones, black_stones):
+    side = BLACK if i & 1 else WHITE
+    white_rank, black_rank = divmod(i >> 1, BINOMIAL[SQUARES][black_stones])
+    return _unrank(white_rank, white_stones), _unrank(black_rank, black_stones), side
+
+
+def generate(path, max_stones=MAX_STONES, verbose=True):
+    """Solves every configuration of at most max_stones stones and writes them to path"""
+    tables = {}
+
+    def probe(white, black, side):
+        if not white or not black:
+            return -1  # The side to move has no stones left, or its opponent has none: see winner()
+        return tables[(len(white), len(black))][index(white, black, side)]
+
+    for white_stones, black_stones in materials(max_stones):
+        if verbose:
+            print(f"Solving {white_stones} white vs {black_stones} black "
+                  f"({table_size(white_stones, black_stones)} positions)")
+        tables[(white_stones, black_stones)] = generate_table(white_stones, black_stones, probe)
+
+    offset = HEADER.size + ENTRY.size * len(tables)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, max_stones, len(tables)))
+        for (white_stones, black_stones), values in tables.items():
+            f.write(ENTRY.pack(white_stones, black_stones, offset, len(values)))
+            offset += len(values)
+        for values in tables.values():
+            f.write(values.tobytes())
+
+
+#----------------------------------------#
+#---------------- Probing ---------------#
+# ---------------------------------------#
+
+class Tablebase:
+    """Read-only view of a generated tablebase file, memory-mapped so it loads instantly"""
+
+    def __init__(self, path):
+        self._file = MappedFile(path, HEADER, MAGIC, 'a tablebase')
+        _, self.max_stones, count = self._file.header
+        self.tables = {}
+        for n in range(count):
+            white_stones, black_stones, offset, length = self._file.unpack(ENTRY, HEADER.size + n * ENTRY.size)
+            self.tables[(white_stones, black_stones)] = self._file.view(offset, length, 'b')
+
+    @staticmethod
+    def load(path):
+        # The tablebase is optional, None when the file has not been generated
+        return Tablebase(path) if os.path.exists(path) else None
+
+    def probe(self, board):
+        """Value of the board for the side to move, or None if its material is not in the tablebase"""
+        counts = board.eval_state.counts
+        table = self.tables.get((counts[1], counts[-1]))
+        if table is None:
+            return None
+        cells = board.cells
+        white = tuple(sq for sq in range(SQUARES) if cells[sq] == 1)
+        black = tuple(sq for sq in range(SQUARES) if cells[sq] == -1)
+        return table[index(white, black, board.side_to_move)]
+
+    def close(self):
+        self.tables = {}
+        self._file.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate the Fianco endgame tablebase")
+    parser.add_argument('--stones', type=int, default=MAX_STONES, help="largest number of stones on the board")
+    parser.add_argument('--output', default=TABLEBASE_PATH)
+    args = parser.parse_args()
+    generate(args.output, args.stones)
\ No newline at end of file
@@ -0,0 +1,34 @@
+from const import *
+from board import Board, MAX_MOVES
+from move import Move
+
+
+def _play(board, notation):
+    code = Move.convert_to_move(notation).encode()
+    buffer = [0] * MAX_MOVES
+    count = board.generate_moves(1 if board.side_to_move == WHITE else -1, buffer)
+    assert code in buffer[:count], notation
+    move = Move.decode(code, board)
+    board.move_piece(move.initial.piece, move)
+
+
+def test_snapshot_keeps_repetitions():
+    # Sideways shuffles after a forward move: a board rebuilt from a snapshot sees the same repetitions
+    board = Board()
+    for notation in ('e1-e2', 'b8-a8', 'e2-d2', 'a8-b8', 'd2-e2', 'b8-a8', 'e2-d2', 'a8-b8', 'd2-e2'):
+        _play(board, notation)
+        rebuilt = Board.from_snapshot(board.snapshot())
+        assert rebuilt.zobrist_key == board.zobrist_key, notation
+        assert rebuilt.position_counts[board.zobrist_key] == board.position_counts[board.zobrist_key], notation
+        assert rebuilt.is_repetition() == board.is_repetition(), notation
+    assert board.is_repetition()
+
+
+def test_set_position_forgets_the_game():
+    board = Board()
+    _play(board, 'e1-e2')
+    board.set_position([(4, 4)], [(2, 3)], BLACK)
+    assert board.move_history == []
+    assert board.captured_pieces == {WHITE: [], BLACK: []}
+    assert board.side_to_move == BLACK
+    assert board.position_counts == {board.zobrist_key: 1}
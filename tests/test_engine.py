@@ -0,0 +1,42 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run_engine(args, commands, until):
+    # Sends the commands and reads the protocol lines until one starts with until, then quits
+    engine = subprocess.Popen([sys.executable, os.path.join(ROOT, 'engine.py'), *args], cwd=ROOT, text=True,
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    # An engine that never answers is killed, which ends the output
+    watchdog = threading.Timer(30, engine.kill)
+    watchdog.start()
+    try:
+        engine.stdin.write(''.join(command + '\n' for command in commands))
+        engine.stdin.flush()
+        lines = []
+        for line in engine.stdout:
+            lines.append(line.strip())
+            if line.startswith(until):
+                break
+        engine.stdin.write('quit\n')
+        engine.stdin.flush()
+        engine.wait(timeout=30)
+    finally:
+        watchdog.cancel()
+        engine.kill()
+    return lines
+
+
+def test_go_with_cache(tmp_path):
+    cache = str(tmp_path / 'cache.db')
+    lines = _run_engine(['--cache', cache], ['uci', 'isready', 'position startpos', 'go depth 5'], 'bestmove')
+    assert 'uciok' in lines and 'readyok' in lines
+    assert any(line.startswith('info depth 5 ') for line in lines)
+    assert lines[-1].startswith('bestmove ') and lines[-1] != 'bestmove (none)'
+    # The search thread wrote its deep results to the cache
+    with sqlite3.connect(cache) as db:
+        assert db.execute("SELECT COUNT(*) FROM positions").fetchone()[0] > 0
\ No newline at end of file
@@ -0,0 +1,15 @@
+from const import *
+import random
+
+# Keys come from a fixed seed so every process hashes a position to the same value
+ZOBRIST_SEED = 0x6F1A7C0
+
+_rng = random.Random(ZOBRIST_SEED)
+
+# One key per colour and square index (row * COLS + col)
+PIECE_KEYS = {
+    WHITE: [_rng.getrandbits(64) for _ in range(ROWS * COLS)],
+    BLACK: [_rng.getrandbits(64) for _ in range(ROWS * COLS)]
+}
+# Mixed in whenever black is to move
+SIDE_KEY = _rng.getrandbits(64)